@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 import dj_database_url
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -54,7 +55,10 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',  # Moved up, right after SecurityMiddleware
+    'authentication.middleware.MetricsMiddleware',
+    'authentication.middleware.AdmissionControlMiddleware',
+    'authentication.middleware.QueryBudgetMiddleware',  # Outermost so it sees every query
+    'authentication.middleware.WhiteNoiseMiddleware',  # Async-capable WhiteNoise, right after SecurityMiddleware
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,6 +67,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'authentication.middleware.UpdateLastActivityMiddleware',
+    'authentication.middleware.ProfilingMiddleware',  # Last, so it wraps only the view
 ]
 
 # CORS settings
@@ -92,6 +97,8 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'x-profile',
+    'idempotency-key',
 ]
 
 # REST Framework settings
@@ -106,6 +113,130 @@ REST_FRAMEWORK = {
 }
 
 GOOGLE_OAUTH2_CLIENT_ID = os.environ.get('GOOGLE_OAUTH2_CLIENT_ID', '902950509892-0berui0km2rssracfjap89hljeu6pq83.apps.googleusercontent.com')
+# Timeout (seconds) for outbound calls to Google from the async login path
+GOOGLE_OAUTH2_HTTP_TIMEOUT = 5.0
+
+# Leaderboard SSE stream (authentication/leaderboard_stream.py, ASGI only)
+LEADERBOARD_STREAM_COALESCE_SECONDS = 0.5
+LEADERBOARD_STREAM_HEARTBEAT_SECONDS = 15
+LEADERBOARD_STREAM_MAX_LIMIT = 50
+
+# Leaderboard read cache (authentication/leaderboard.py). Stale entries are served
+# for LEADERBOARD_STALE_SECONDS while a single caller revalidates them.
+LEADERBOARD_CACHE_SECONDS = 10
+LEADERBOARD_STALE_SECONDS = 60
+LEADERBOARD_CACHE_DEPTH = 100
+# Coalesce cache misses across workers with a cache lock (needs a shared cache backend)
+SINGLE_FLIGHT_CROSS_WORKER = os.environ.get('SINGLE_FLIGHT_CROSS_WORKER', 'False') == 'True'
+SINGLE_FLIGHT_LOCK_SECONDS = 10
+
+# Per-player best scores (GameScoreView.get), one map per player in their own
+# cache. Submissions write through to this process's copy only, so with the
+# local-memory cache another worker can show the previous best for up to
+# BEST_SCORES_CACHE_SECONDS; raise it only with a shared cache backend.
+BEST_SCORES_CACHE = 'best_scores'
+BEST_SCORES_CACHE_SECONDS = 15
+
+# Score distribution buckets (authentication/histograms.py). Changing the width
+# requires `manage.py rebuild_score_histograms`.
+SCORE_HISTOGRAM_BUCKET_WIDTH = 5
+
+# Per-view query budgets (authentication/query_budgets.py): 'raise', 'log' or
+# 'off'. Queries are recorded for the DB metrics in every mode.
+QUERY_BUDGET_MODE = os.environ.get('QUERY_BUDGET_MODE', 'log')
+
+# On-demand view profiling (authentication/profiling.py). Staff can request a
+# profile with the X-Profile header or ?profile=1; otherwise requests are sampled.
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_MAX_FILES = 100
+
+# /metrics (authentication/metrics.py). Set PROMETHEUS_MULTIPROC_DIR in the
+# environment to aggregate across gunicorn workers (gunicorn.conf.py cleans up
+# after exited workers).
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Caches. Rate limiter buckets, best scores and sessions each get their own
+# local-memory cache so they never evict (or get evicted by) cached
+# leaderboards. Idempotency keys must be seen by every worker a retry can land
+# on, so they live in files on the host's disk; with several hosts, point
+# IDEMPOTENCY_CACHE_DIR at shared storage or the alias at Redis/Memcached.
+# The file cache lists its directory on every write, hence the lower cap.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'ratelimit': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'ratelimit',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'best_scores': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'best_scores',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'sessions',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    'idempotency': {
+        'BACKEND': 'authentication.cache_backends.FileBasedCache',
+        'LOCATION': os.environ.get(
+            'IDEMPOTENCY_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'fretszy-idempotency')
+        ),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Token-bucket rate limits per scope (authentication/ratelimit.py): up to
+# `capacity` requests in a burst, refilled at `refill_per_second`.
+RATE_LIMIT_CACHE = 'ratelimit'
+# Reverse proxies in front of the app (PythonAnywhere has one). Anonymous
+# clients are keyed by the address the outermost of them saw, not by
+# client-supplied X-Forwarded-For entries.
+TRUSTED_PROXY_COUNT = int(os.environ.get(
+    'TRUSTED_PROXY_COUNT', '1' if os.environ.get('PYTHONANYWHERE', 'False') == 'True' else '0'
+))
+RATE_LIMITS = {
+    'login': {'capacity': 10, 'refill_per_second': 10 / 60},
+    'register': {'capacity': 5, 'refill_per_second': 5 / 3600},
+    'score-submit': {'capacity': 30, 'refill_per_second': 1},
+}
+
+# Sessions are read from the 'sessions' cache and written to the database behind
+# the request (authentication/session_backend.py). The cache is per worker, so
+# logged-in sessions found in it are checked against the database before use,
+# and SESSION_CACHE_SECONDS bounds how long another worker's cache can serve a
+# session's previous data. With several workers, point 'sessions' at a shared
+# backend (Redis, Memcached) and set SESSION_CACHE_SHARED = True to skip the check.
+SESSION_ENGINE = 'authentication.session_backend'
+SESSION_CACHE_ALIAS = 'sessions'
+SESSION_CACHE_SECONDS = 30
+SESSION_CACHE_SHARED = False
+
+# Idempotency-Key replay (authentication/idempotency.py): how long responses are
+# kept for retries, and how long a retry waits out an in-flight first attempt.
+# The cache must be shared across processes and its add() atomic; with a
+# per-worker one a retry routed to another worker runs the request again.
+IDEMPOTENCY_CACHE = 'idempotency'
+IDEMPOTENCY_TTL = 24 * 60 * 60
+IDEMPOTENCY_LOCK_SECONDS = 30
+
+# Admission control (authentication/admission.py): concurrent requests per
+# worker, and how long each priority class may queue before being shed.
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '16'))
+ADMISSION_QUEUE_TIMEOUTS = {'read': 2.0, 'write': 1.0, 'login': 0.5, 'admin': 0.25}
+ADMISSION_RETRY_AFTER = 2
+
+# Background tasks (authentication/tasks.py). Tasks listed in
+# BACKGROUND_TASKS_DURABLE go to the database and need `manage.py run_background_tasks`.
+BACKGROUND_TASKS_ENABLED = True
+BACKGROUND_TASKS_QUEUE_SIZE = 1000
+BACKGROUND_TASKS_BATCH_SIZE = 100
+BACKGROUND_TASKS_SHUTDOWN_TIMEOUT = 5
+BACKGROUND_TASKS_DURABLE = []
 
 #Custom user model
 AUTH_USER_MODEL = 'authentication.User'
@@ -152,7 +283,6 @@ if os.environ.get('PYTHONANYWHERE', 'False') == 'True':
             },
         }
     }
-    print("📡 Using DB HOST:", DATABASES['default']['HOST'])
 else:
     # Local MySQL settings for development
     DATABASES = {
@@ -1,9 +1,11 @@
 from django.contrib import admin
 from django.urls import path, include
 from .views import api_root  # Import the view we created
+from authentication.metrics import metrics_view
 
 urlpatterns = [
     path('', api_root, name='api-root'),  # Add this line
     path('admin/', admin.site.urls),
     path('api/', include('authentication.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -0,0 +1,119 @@
+# authentication/admission.py
+"""
+Admission control and load shedding.
+
+Each worker process admits at most ``ADMISSION_MAX_IN_FLIGHT`` concurrent
+requests. Requests that find it full wait in priority order - reads, then
+other writes, then logins, then admin - and are shed with 503 and
+``Retry-After`` once they exceed their class's queue-time budget
+(``ADMISSION_QUEUE_TIMEOUTS``). Time already spent queued upstream, taken
+from an ``X-Request-Start`` header set by the proxy, counts against the
+budget too, which is what catches backlog in front of sync workers.
+Under ASGI, queued requests poll for a slot instead of blocking the event
+loop.
+"""
+import asyncio
+import threading
+import time
+
+from django.conf import settings
+
+READ, WRITE, LOGIN, ADMIN = range(4)
+PRIORITY_NAMES = ('read', 'write', 'login', 'admin')
+
+LOGIN_PATHS = ('/api/auth/login/', '/api/auth/register/', '/api/auth/google/')
+
+# How often an async request queued by ``AdmissionController.aacquire`` checks for a slot
+ASYNC_POLL_SECONDS = 0.01
+
+
+def request_priority(request):
+    path = request.path_info
+    if path.startswith('/admin/'):
+        return ADMIN
+    if request.method == 'POST' and path.startswith(LOGIN_PATHS):
+        return LOGIN
+    if request.method in ('GET', 'HEAD', 'OPTIONS'):
+        return READ
+    return WRITE
+
+
+def upstream_queue_seconds(request):
+    """Time since the proxy received the request (``X-Request-Start: t=<epoch>``)"""
+    header = request.META.get('HTTP_X_REQUEST_START')
+    if not header:
+        return 0.0
+    try:
+        started = float(header.split('t=')[-1])
+    except ValueError:
+        return 0.0
+    # Proxies send seconds, milliseconds or microseconds since the epoch
+    while started > 1e11:
+        started /= 1000
+    return max(0.0, time.time() - started)
+
+
+def queue_budget(priority):
+    timeouts = getattr(settings, 'ADMISSION_QUEUE_TIMEOUTS', {})
+    return timeouts.get(PRIORITY_NAMES[priority], 1.0)
+
+
+class AdmissionController:
+    """In-flight limit with priority-ordered waiting, per worker process"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = [0] * len(PRIORITY_NAMES)
+        self.condition = threading.Condition()
+
+    def _take(self, ahead):
+        """Take a free slot unless one of the first ``ahead`` priority classes is waiting; needs the lock"""
+        if self.in_flight < self.limit and not any(self.waiting[:ahead]):
+            self.in_flight += 1
+            return True
+        return False
+
+    def acquire(self, priority, timeout):
+        """Take a slot, waiting up to ``timeout`` seconds; False means shed"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            if self._take(priority + 1):
+                return True
+            self.waiting[priority] += 1
+            try:
+                while True:
+                    # Only take a free slot if nobody more important is waiting
+                    if self._take(priority):
+                        return True
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self.condition.wait(remaining)
+            finally:
+                self.waiting[priority] -= 1
+
+    async def aacquire(self, priority, timeout):
+        """``acquire`` for the event loop: polls for a slot rather than blocking on the condition"""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            if self._take(priority + 1):
+                return True
+            self.waiting[priority] += 1
+        try:
+            while True:
+                with self.condition:
+                    if self._take(priority):
+                        return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                await asyncio.sleep(min(ASYNC_POLL_SECONDS, remaining))
+        finally:
+            with self.condition:
+                self.waiting[priority] -= 1
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
@@ -7,4 +7,10 @@ class AuthenticationConfig(AppConfig):
     
     def ready(self):
         # Import signal handlers
-        import authentication.signals
\ No newline at end of file
+        import authentication.signals
+        # Register the query budget system check
+        import authentication.query_budgets
+        # Register background task handlers not imported by the signals above
+        import authentication.histograms
+        import authentication.skill
+        import authentication.session_backend
\ No newline at end of file
@@ -0,0 +1,154 @@
+# authentication/async_views.py
+"""
+Async views, served natively by the ASGI application.
+
+``google_login_async`` is the non-blocking counterpart of ``GoogleLoginView``:
+Google's signing certificates are fetched with an async HTTP client (with
+timeouts, cached for as long as Google's ``Cache-Control`` allows), the ID
+token is verified locally, and the user upsert and token lookup go through
+the async ORM. A slow Google response parks a coroutine instead of a worker;
+every middleware is async-capable (``middleware.AsyncCapableMiddleware``), so
+no thread is held for the request either.
+"""
+import asyncio
+import json
+import re
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+
+from .serializers import UserSerializer, GoogleAuthSerializer
+from .metrics import LOGINS
+from .ratelimit import consume
+from .signals import get_client_ip
+
+User = get_user_model()
+
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v1/certs'
+GOOGLE_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+
+_certs_cache = {'certs': None, 'expires': 0.0}
+_certs_lock = asyncio.Lock()
+
+
+def _max_age(cache_control):
+    match = re.search(r'max-age=(\d+)', cache_control or '')
+    return int(match.group(1)) if match else 0
+
+
+async def get_google_certs():
+    """Google's OAuth2 signing certificates, fetched at most once per max-age"""
+    if _certs_cache['certs'] is not None and _certs_cache['expires'] > time.monotonic():
+        return _certs_cache['certs']
+    async with _certs_lock:
+        # Another coroutine may have refreshed them while we waited
+        if _certs_cache['certs'] is not None and _certs_cache['expires'] > time.monotonic():
+            return _certs_cache['certs']
+        import httpx
+        timeout = httpx.Timeout(getattr(settings, 'GOOGLE_OAUTH2_HTTP_TIMEOUT', 5.0))
+        async with httpx.AsyncClient(timeout=timeout) as client:
+            response = await client.get(GOOGLE_CERTS_URL)
+            response.raise_for_status()
+        _certs_cache['certs'] = response.json()
+        _certs_cache['expires'] = time.monotonic() + _max_age(response.headers.get('cache-control'))
+        return _certs_cache['certs']
+
+
+async def verify_google_credential(credential):
+    """Async equivalent of ``id_token.verify_oauth2_token``"""
+    from google.auth import jwt
+    certs = await get_google_certs()
+    idinfo = jwt.decode(credential, certs=certs, audience=settings.GOOGLE_OAUTH2_CLIENT_ID)
+    if idinfo.get('iss') not in GOOGLE_ISSUERS:
+        raise ValueError('Wrong issuer')
+    return idinfo
+
+
+async def _upsert_google_user(idinfo):
+    email = idinfo['email']
+    first_name = idinfo.get('given_name', '')
+    last_name = idinfo.get('family_name', '')
+    photo_url = idinfo.get('picture', '')
+    try:
+        user = await User.objects.aget(email=email)
+        # Update existing user info
+        user.first_name = first_name
+        user.last_name = last_name
+        user.photo_url = photo_url
+        user.provider = 'google'
+        await user.asave()
+    except User.DoesNotExist:
+        # Don't set password for social auth users
+        user = await User.objects.acreate_user(
+            username=email.split('@')[0],
+            email=email,
+            first_name=first_name,
+            last_name=last_name,
+            photo_url=photo_url,
+            provider='google',
+        )
+    return user
+
+
+@csrf_exempt
+@require_POST
+async def google_login_async(request):
+    """Google login without blocking a worker on Google's certificate endpoint"""
+    # httpx and google.auth are only needed here; importing them lazily keeps
+    # them off every worker's startup path
+    import httpx
+    
+    # Keyed by IP: request.user would need a sync session lookup here
+    allowed, retry_after = consume('login', f"ip:{get_client_ip(request)}")
+    if not allowed:
+        response = JsonResponse({'detail': 'Request was throttled.'}, status=status.HTTP_429_TOO_MANY_REQUESTS)
+        response['Retry-After'] = str(int(retry_after) + 1)
+        return response
+
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid JSON body'}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = GoogleAuthSerializer(data=data)
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    credential = serializer.validated_data['credential']
+
+    try:
+        idinfo = await verify_google_credential(credential)
+    except httpx.HTTPError as e:
+        print(f"Google certificate fetch failed: {str(e)}")
+        LOGINS.labels('google', 'error').inc()
+        return JsonResponse({'error': 'Could not reach Google'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except ValueError as e:
+        print(f"Google token verification error: {str(e)}")
+        LOGINS.labels('google', 'invalid').inc()
+        return JsonResponse({'error': f'Invalid token: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if not idinfo.get('email'):
+        LOGINS.labels('google', 'invalid').inc()
+        return JsonResponse({'error': 'Email not found in token'}, status=status.HTTP_400_BAD_REQUEST)
+    if not idinfo.get('email_verified', False):
+        LOGINS.labels('google', 'invalid').inc()
+        return JsonResponse({'error': 'Email not verified by Google'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        user = await _upsert_google_user(idinfo)
+        token, created = await Token.objects.aget_or_create(user=user)
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        LOGINS.labels('google', 'error').inc()
+        return JsonResponse({'error': f'Server error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    LOGINS.labels('google', 'success').inc()
+    return JsonResponse({
+        'token': token.key,
+        'user': UserSerializer(user).data
+    }, status=status.HTTP_200_OK)
@@ -0,0 +1,38 @@
+# authentication/cache_backends.py
+"""
+Cache backends for state that every worker on a host must share without
+going through the database.
+
+``FileBasedCache`` is Django's file cache with an ``add()`` that is atomic
+across processes: the entry is written to a temporary file and hard-linked
+into place, which fails if another process got there first. That makes
+``add()`` usable as a lock (see ``idempotency.py``); Django's own checks for
+the key and then writes it, so two workers can both "add" the same key.
+"""
+import os
+import tempfile
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends import filebased
+
+
+class FileBasedCache(filebased.FileBasedCache):
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        # has_key() also removes the file of an expired entry
+        if self.has_key(key, version):
+            return False
+        self._createdir()
+        self._cull()
+        fd, tmp_path = tempfile.mkstemp(dir=self._dir)
+        try:
+            with open(fd, 'wb') as f:
+                self._write_content(f, timeout, value)
+            # Unlike a rename, link() never replaces an existing entry, and
+            # readers only ever see a complete file
+            os.link(tmp_path, self._key_to_file(key, version))
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(tmp_path)
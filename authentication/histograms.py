@@ -0,0 +1,94 @@
+# authentication/histograms.py
+"""
+Per-configuration histograms of players' best scores.
+
+``GameScoreView.post`` keeps the ``ScoreBucket`` counts up to date as best
+scores are created or improved, so percentile lookups read one row per bucket
+instead of counting over ``GameScore``. Migration 0009 fills them from the
+scores that predate the table; ``manage.py rebuild_score_histograms``
+recomputes them from scratch if they ever drift.
+"""
+from collections import Counter
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import F
+
+from .models import GameScore, ScoreBucket
+from .tasks import background_task
+
+
+def bucket_width():
+    return max(1, getattr(settings, 'SCORE_HISTOGRAM_BUCKET_WIDTH', 5))
+
+
+def bucket_for(score):
+    return score // bucket_width()
+
+
+def _adjust(config_key, bucket, delta):
+    buckets = ScoreBucket.objects.filter(config_id=config_key, bucket=bucket)
+    if buckets.update(count=F('count') + delta) or delta < 0:
+        return
+    try:
+        with transaction.atomic():
+            ScoreBucket.objects.create(config_id=config_key, bucket=bucket, count=delta)
+    except IntegrityError:
+        # Created concurrently by another request
+        buckets.update(count=F('count') + delta)
+
+
+@background_task('record_score_change')
+def record_score_change(config_key, new_score, previous_score=None):
+    """Move a player from ``previous_score``'s bucket (None for a new player) to ``new_score``'s"""
+    new_bucket = bucket_for(new_score)
+    if previous_score is not None:
+        old_bucket = bucket_for(previous_score)
+        if old_bucket == new_bucket:
+            return
+        ScoreBucket.objects.filter(
+            config_id=config_key, bucket=old_bucket, count__gt=0
+        ).update(count=F('count') - 1)
+    _adjust(config_key, new_bucket, 1)
+
+
+def get_histogram(config_key):
+    """Non-empty buckets in ascending order as (bucket, count) pairs"""
+    return list(ScoreBucket.objects.filter(
+        config_id=config_key, count__gt=0
+    ).order_by('bucket').values_list('bucket', 'count'))
+
+
+def percentile(histogram, score):
+    """
+    Percentage of players with a lower best score than ``score``, linearly
+    interpolated within ``score``'s own bucket.
+    """
+    width = bucket_width()
+    own_bucket = bucket_for(score)
+    total = below = within = 0
+    for bucket, count in histogram:
+        total += count
+        if bucket < own_bucket:
+            below += count
+        elif bucket == own_bucket:
+            within = count
+    if not total:
+        return 0.0
+    fraction = (score - own_bucket * width) / width
+    return round(100.0 * (below + within * fraction) / total, 1)
+
+
+def rebuild_histograms():
+    """Recompute every bucket from ``GameScore``; returns the number of buckets written"""
+    counts = Counter()
+    for config_id, score in GameScore.objects.values_list('config_id', 'score').iterator():
+        counts[(config_id, bucket_for(score))] += 1
+
+    with transaction.atomic():
+        ScoreBucket.objects.all().delete()
+        ScoreBucket.objects.bulk_create([
+            ScoreBucket(config_id=config_id, bucket=bucket, count=count)
+            for (config_id, bucket), count in counts.items()
+        ], batch_size=1000)
+    return len(counts)
@@ -0,0 +1,116 @@
+# authentication/idempotency.py
+"""
+``Idempotency-Key`` support for POSTs that clients retry.
+
+The first request with a given key runs normally and its response (status
+and data) is cached for ``IDEMPOTENCY_TTL`` seconds; retries with the same
+key get that response replayed, marked ``Idempotent-Replayed: true``, without
+running the view again. Only a 16-byte fingerprint of the request is kept
+alongside the response, and a key reused with a different payload is
+rejected with 422. A retry that arrives while the first request is still
+running gets 409 with ``Retry-After``. Server errors are not cached so they
+can be retried.
+
+Keys are scoped per view and per client (see ``ratelimit.client_key``).
+Entries live in the ``IDEMPOTENCY_CACHE`` alias and expire with the cache
+timeout. That cache has to be shared by every worker: with a per-process one,
+a retry routed to a different worker misses the entry and runs the request
+again. It stays out of the database (``cache_backends.FileBasedCache`` by
+default), so a replayed retry costs no queries at all.
+"""
+import functools
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from .metrics import IDEMPOTENCY
+from .ratelimit import client_key
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+# Placeholder stored while the first request is running
+IN_PROGRESS = None
+
+
+def _cache():
+    return caches[getattr(settings, 'IDEMPOTENCY_CACHE', 'default')]
+
+
+def fingerprint(request):
+    """Compact digest of the method, path and (order-insensitive) payload"""
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps(data, sort_keys=True, separators=(',', ':'), default=str)
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (request.method, request.path, payload):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    return digest.digest()
+
+
+def _replay(entry):
+    _, status_code, data = entry
+    response = Response(data, status=status_code)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(scope):
+    """Decorate an APIView handler to honour the ``Idempotency-Key`` header"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            key = request.META.get(HEADER)
+            if not key:
+                return handler(view, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response({
+                    'error': f'Idempotency-Key must be at most {MAX_KEY_LENGTH} characters'
+                }, status=status.HTTP_400_BAD_REQUEST)
+
+            cache = _cache()
+            cache_key = "idempotency:{}:{}:{}".format(
+                scope, client_key(request), hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+            )
+            request_fingerprint = fingerprint(request)
+            placeholder = (request_fingerprint, IN_PROGRESS, None)
+            if not cache.add(cache_key, placeholder, getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 30)):
+                entry = cache.get(cache_key)
+                if entry is not None:
+                    if entry[0] != request_fingerprint:
+                        IDEMPOTENCY.labels(scope, 'mismatch').inc()
+                        return Response({
+                            'error': 'Idempotency-Key was already used with a different request'
+                        }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                    if entry[1] is IN_PROGRESS:
+                        IDEMPOTENCY.labels(scope, 'conflict').inc()
+                        response = Response({
+                            'error': 'A request with this Idempotency-Key is still in progress'
+                        }, status=status.HTTP_409_CONFLICT)
+                        response['Retry-After'] = '1'
+                        return response
+                    IDEMPOTENCY.labels(scope, 'replayed').inc()
+                    return _replay(entry)
+                # Expired between add() and get(); claim it
+                cache.set(cache_key, placeholder, getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 30))
+
+            try:
+                response = handler(view, request, *args, **kwargs)
+            except Exception:
+                cache.delete(cache_key)
+                raise
+            if response.status_code >= 500 or not hasattr(response, 'data'):
+                cache.delete(cache_key)
+            else:
+                cache.set(cache_key, (request_fingerprint, response.status_code, response.data),
+                          getattr(settings, 'IDEMPOTENCY_TTL', 24 * 60 * 60))
+                IDEMPOTENCY.labels(scope, 'stored').inc()
+            return response
+        return wrapper
+    return decorator
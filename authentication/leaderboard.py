@@ -0,0 +1,142 @@
+# authentication/leaderboard.py
+"""
+Leaderboard and best-score reads shared by the HTTP views and the SSE stream.
+
+Entries are tuples ordered like ``LEADERBOARD_FIELDS`` (the fields of
+``GameScoreSummarySerializer``), read with ``values_list`` so no model
+instances or per-row dicts are built; ``renderers.table`` shapes them for the
+response. Configurations are identified by their ``GameConfig`` key (see
+``models.game_config_key``), so every game type is read the same way.
+
+The top ``LEADERBOARD_CACHE_DEPTH`` entries of each configuration are cached
+as one list and sliced per request, so every ``limit`` shares a single cache
+entry and a single in-flight query (see ``single_flight``).
+
+Each player's best scores for every configuration are cached together,
+loaded in one query on first access and updated write-through by
+``best_score_changed`` when a score is created or improved.
+"""
+from django.conf import settings
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from rest_framework import serializers
+
+from .models import GameScore
+from .single_flight import cached_single_flight, mark_stale, write_through
+
+LEADERBOARD_FIELDS = ('score', 'date_achieved', 'fret_length', 'start_string', 'end_string', 'username')
+_COLUMNS = ('score', 'date_achieved', 'fret_length', 'start_string', 'end_string', 'user__username')
+
+# Formats dates exactly like the serializer did
+_date_field = serializers.DateTimeField()
+
+
+def _entry(row):
+    score, date_achieved, fret_length, start_string, end_string, username = row
+    return (score, _date_field.to_representation(date_achieved), fret_length, start_string, end_string, username)
+
+
+def fetch_top_rows(config_key, limit):
+    """Top-N entries for one configuration as ``LEADERBOARD_FIELDS`` tuples"""
+    top_scores = GameScore.objects.filter(
+        config_id=config_key
+    ).order_by('-score').values_list(*_COLUMNS)[:limit]
+    return [_entry(row) for row in top_scores]
+
+
+def fetch_top_scores(config_key, limit):
+    """Top-N entries for one configuration as dicts, like ``leaderboard``'s JSON"""
+    rows = fetch_top_rows(config_key, limit)
+    return [dict(zip(LEADERBOARD_FIELDS, row)) for row in rows]
+
+
+def fetch_top_scores_batch(config_keys, limit):
+    """
+    Top-N entries for several configurations in one query, using
+    ROW_NUMBER() OVER (PARTITION BY config ORDER BY score DESC).
+
+    Returns a dict mapping each config key to its ``LEADERBOARD_FIELDS`` rows.
+    """
+    boards = {config_key: [] for config_key in config_keys}
+    if not boards:
+        return boards
+
+    ranked = GameScore.objects.filter(config_id__in=boards).annotate(
+        rank=Window(
+            expression=RowNumber(),
+            partition_by=[F('config')],
+            order_by=F('score').desc(),
+        )
+    ).filter(rank__lte=limit).order_by('rank').values_list('config_id', *_COLUMNS)
+
+    for config_id, *row in ranked:
+        boards[config_id].append(_entry(row))
+    return boards
+
+
+def _leaderboard_key(config_key):
+    return f"leaderboard:{config_key}"
+
+
+def get_leaderboard(config_key, limit):
+    """Top-N ``LEADERBOARD_FIELDS`` rows, cached"""
+    limit = max(limit, 0)
+    depth = getattr(settings, 'LEADERBOARD_CACHE_DEPTH', 100)
+    if limit > depth:
+        return fetch_top_rows(config_key, limit)
+
+    entries = cached_single_flight(
+        _leaderboard_key(config_key),
+        lambda: fetch_top_rows(config_key, depth),
+        ttl=getattr(settings, 'LEADERBOARD_CACHE_SECONDS', 10),
+        stale_ttl=getattr(settings, 'LEADERBOARD_STALE_SECONDS', 60),
+    )
+    return entries[:limit]
+
+
+def leaderboard_changed(config_key):
+    """Called after a score is created or improved"""
+    mark_stale(
+        _leaderboard_key(config_key),
+        getattr(settings, 'LEADERBOARD_STALE_SECONDS', 60),
+    )
+
+
+def _best_scores_key(user_id):
+    return f"best_scores:{user_id}"
+
+
+def _best_entry(score, date_achieved, fret_length, start_string, end_string):
+    return (score, _date_field.to_representation(date_achieved), fret_length, start_string, end_string)
+
+
+def fetch_best_scores(user_id):
+    """All of a user's best scores in one query, keyed by config key"""
+    rows = GameScore.objects.filter(user_id=user_id).values_list('config_id', *_COLUMNS[:-1])
+    return {config_id: _best_entry(*row) for config_id, *row in rows}
+
+
+def get_best_score(user, config_key):
+    """The user's best score for a configuration as a ``LEADERBOARD_FIELDS`` dict, or None"""
+    best_scores = cached_single_flight(
+        _best_scores_key(user.pk),
+        lambda: fetch_best_scores(user.pk),
+        ttl=getattr(settings, 'BEST_SCORES_CACHE_SECONDS', 15),
+        using=getattr(settings, 'BEST_SCORES_CACHE', 'default'),
+    )
+    entry = best_scores.get(config_key)
+    if entry is None:
+        return None
+    return dict(zip(LEADERBOARD_FIELDS, (*entry, user.username)))
+
+
+def best_score_changed(game_score):
+    """Write a created or improved score through to its user's cached best scores"""
+    entry = _best_entry(game_score.score, game_score.date_achieved, game_score.fret_length,
+                        game_score.start_string, game_score.end_string)
+    write_through(
+        _best_scores_key(game_score.user_id),
+        lambda best_scores: {**best_scores, game_score.config_id: entry},
+        ttl=getattr(settings, 'BEST_SCORES_CACHE_SECONDS', 15),
+        using=getattr(settings, 'BEST_SCORES_CACHE', 'default'),
+    )
@@ -0,0 +1,200 @@
+# authentication/leaderboard_stream.py
+"""
+Server-Sent Events push for leaderboards.
+
+Clients subscribe to ``/api/leaderboard/stream/`` for one game configuration
+and receive the current top-N straight away, then a new event only when the
+top-N actually changes. Everything lives in-process: one channel per
+(config key, limit), one shared ``asyncio.Event`` per channel that idle
+subscribers wait on, so thousands of open streams cost a parked coroutine
+each and nothing else.
+
+Score writes call ``notify_score_changed`` from the (sync) request thread.
+Notifications for the same channel are coalesced for
+``LEADERBOARD_STREAM_COALESCE_SECONDS`` and the leaderboard is queried once,
+no matter how many scores came in or how many clients are listening.
+
+This needs the ASGI application (``GuitarGamesBE.asgi``), e.g.
+``gunicorn -k uvicorn.workers.UvicornWorker GuitarGamesBE.asgi:application``.
+Under WSGI the stream would never end and would pin a sync worker for as long
+as the client stays connected (Django drains async streaming content into a
+list there), so the route answers 501 instead.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.authtoken.models import Token
+
+from .leaderboard import fetch_top_scores
+from .models import request_config_key
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class LeaderboardChannel:
+    """Latest top-N snapshot for one (config key, limit) plus its subscribers"""
+
+    def __init__(self, config, limit):
+        self.config = config
+        self.limit = limit
+        self.snapshot = None
+        self.version = 0
+        self.subscribers = 0
+        self.changed = asyncio.Event()
+        self.load_lock = asyncio.Lock()
+
+    async def ensure_loaded(self):
+        if self.snapshot is not None:
+            return
+        async with self.load_lock:
+            if self.snapshot is None:
+                self.snapshot = await sync_to_async(fetch_top_scores)(self.config, self.limit)
+
+    def publish(self, snapshot):
+        """Store a new snapshot and wake every waiting subscriber at once"""
+        self.snapshot = snapshot
+        self.version += 1
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    def could_change(self, score):
+        """Cheap pre-check: a score below a full board's last entry can't change it"""
+        if self.snapshot is None or len(self.snapshot) < self.limit:
+            return True
+        return score is None or score >= self.snapshot[-1]['score']
+
+
+class LeaderboardBroker:
+    """Process-local pub/sub for leaderboard channels"""
+
+    def __init__(self):
+        self.loop = None
+        self.channels = {}
+        self.pending = set()
+
+    def subscribe(self, config, limit):
+        self.loop = asyncio.get_running_loop()
+        key = (config, limit)
+        channel = self.channels.get(key)
+        if channel is None:
+            channel = self.channels[key] = LeaderboardChannel(config, limit)
+        channel.subscribers += 1
+        return channel
+
+    def unsubscribe(self, channel):
+        channel.subscribers -= 1
+        if channel.subscribers <= 0:
+            self.channels.pop((channel.config, channel.limit), None)
+
+    def notify(self, config, score=None):
+        """Thread-safe: schedule a coalesced refresh of every channel for ``config``"""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._schedule_refresh, config, score)
+
+    def _schedule_refresh(self, config, score):
+        for key, channel in list(self.channels.items()):
+            if channel.config != config or key in self.pending:
+                continue
+            if not channel.could_change(score):
+                continue
+            self.pending.add(key)
+            self.loop.call_later(
+                _setting('LEADERBOARD_STREAM_COALESCE_SECONDS', 0.5),
+                lambda key=key: asyncio.ensure_future(self._refresh(key)),
+            )
+
+    async def _refresh(self, key):
+        self.pending.discard(key)
+        channel = self.channels.get(key)
+        if channel is None:
+            return
+        try:
+            snapshot = await sync_to_async(fetch_top_scores)(channel.config, channel.limit)
+        except Exception as e:
+            print(f"Leaderboard stream refresh failed for {key}: {str(e)}")
+            return
+        if snapshot != channel.snapshot:
+            channel.publish(snapshot)
+
+
+broker = LeaderboardBroker()
+
+
+def notify_score_changed(config_key, score=None):
+    """Called after a score is created or improved"""
+    broker.notify(config_key, score)
+
+
+def _format_event(channel):
+    payload = json.dumps({'version': channel.version, 'entries': channel.snapshot}, default=str)
+    return f"id: {channel.version}\nevent: leaderboard\ndata: {payload}\n\n"
+
+
+async def _event_stream(config_key, limit):
+    heartbeat = _setting('LEADERBOARD_STREAM_HEARTBEAT_SECONDS', 15)
+    # Subscribed here, not in the view, so a response that is never iterated
+    # (client gone before the first chunk) doesn't leave a subscriber behind
+    channel = broker.subscribe(config_key, limit)
+    try:
+        await channel.ensure_loaded()
+        seen = channel.version
+        yield _format_event(channel)
+        while True:
+            if channel.version == seen:
+                try:
+                    await asyncio.wait_for(channel.changed.wait(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+            # Slow clients skip straight to the latest snapshot
+            seen = channel.version
+            yield _format_event(channel)
+    finally:
+        broker.unsubscribe(channel)
+
+
+async def _authenticate(request):
+    """Token (header or ``?token=`` for EventSource) or session authentication"""
+    key = None
+    auth = request.headers.get('Authorization', '')
+    if auth.startswith('Token '):
+        key = auth[len('Token '):].strip()
+    key = key or request.GET.get('token')
+    if key:
+        token = await Token.objects.select_related('user').filter(key=key).afirst()
+        if token and token.user.is_active:
+            return token.user
+        return None
+    user = await request.auser()
+    return user if user.is_authenticated else None
+
+
+@require_GET
+async def leaderboard_stream(request):
+    """Stream the leaderboard for a specific game configuration as SSE"""
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail': 'Leaderboard streaming is only served by the ASGI application.'},
+                            status=501)
+    if await _authenticate(request) is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    try:
+        config_key = request_config_key(request.GET)
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        return JsonResponse({'error': 'Invalid game configuration parameters'}, status=400)
+    limit = max(1, min(limit, _setting('LEADERBOARD_STREAM_MAX_LIMIT', 50)))
+
+    response = StreamingHttpResponse(_event_stream(config_key, limit), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
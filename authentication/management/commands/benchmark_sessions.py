@@ -0,0 +1,64 @@
+# authentication/management/commands/benchmark_sessions.py
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from authentication.tasks import executor
+
+ENGINES = ('django.contrib.sessions.backends.db', 'authentication.session_backend')
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-request session overhead of the database engine and SESSION_ENGINE. "
+        "Writes deferred to the background thread are not counted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--sessions', type=int, default=50)
+        parser.add_argument('--write-every', type=int, default=10,
+                            help="Modify the session on every Nth request (0 = never)")
+
+    def handle(self, *args, **options):
+        engines = list(dict.fromkeys(ENGINES + (settings.SESSION_ENGINE,)))
+        self.stdout.write(f"{'us/request':>11} {'queries/request':>16}  engine (request path only)")
+        for engine in engines:
+            elapsed, queries = self._run(import_module(engine).SessionStore, **options)
+            self.stdout.write(f"{elapsed * 1e6:11.1f} {queries:16.2f}  {engine}")
+
+    def _run(self, store_class, requests, sessions, write_every, **options):
+        keys = []
+        for i in range(sessions):
+            store = store_class()
+            store['_auth_user_id'] = str(i)
+            store.create()
+            keys.append(store.session_key)
+
+        queries = []
+
+        def count(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        try:
+            with connection.execute_wrapper(count):
+                start = time.perf_counter()
+                for n in range(requests):
+                    # What SessionMiddleware and auth do per request
+                    store = store_class(keys[n % sessions])
+                    store.get('_auth_user_id')
+                    if write_every and n % write_every == 0:
+                        store['last_seen'] = n
+                    if store.modified:
+                        store.save()
+                elapsed = time.perf_counter() - start
+        finally:
+            # Let queued session writes land before deleting the sessions
+            executor.shutdown()
+            for key in keys:
+                store_class().delete(key)
+        return elapsed / requests, len(queries) / requests
@@ -0,0 +1,75 @@
+# authentication/management/commands/benchmark_startup.py
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Runs in a fresh interpreter: start the WSGI app and serve one request, then
+# report when each stage finished (epoch seconds)
+WORKER = """
+import io, json, sys, time
+stages = {}
+from django.core.wsgi import get_wsgi_application
+application = get_wsgi_application()
+stages['setup'] = time.time()
+from django.urls import get_resolver
+get_resolver().url_patterns
+stages['urls'] = time.time()
+path, host = sys.argv[1], sys.argv[2]
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': '', 'SERVER_NAME': host,
+    'SERVER_PORT': '80', 'HTTP_HOST': host, 'SERVER_PROTOCOL': 'HTTP/1.1', 'wsgi.version': (1, 0),
+    'wsgi.url_scheme': 'http', 'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+    'wsgi.multithread': False, 'wsgi.multiprocess': True, 'wsgi.run_once': False,
+}
+status = []
+b''.join(application(environ, lambda s, headers, exc_info=None: status.append(s)))
+stages['response'] = time.time()
+print(json.dumps({'status': status[0], 'stages': stages}))
+"""
+
+STAGES = ('setup', 'urls', 'response')
+
+
+class Command(BaseCommand):
+    help = "Measure time to first response for fresh worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--path', default='/api/leaderboard/')
+
+    def handle(self, *args, **options):
+        host = next((h for h in settings.ALLOWED_HOSTS if not h.startswith(('.', '*'))), 'localhost')
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+        timings = {stage: [] for stage in STAGES}
+
+        for run in range(options['runs']):
+            started = time.time()
+            result = subprocess.run(
+                [sys.executable, '-c', WORKER, options['path'], host],
+                capture_output=True, text=True, env=env,
+            )
+            if result.returncode != 0:
+                self.stderr.write(result.stderr)
+                return
+            report = json.loads(result.stdout.strip().splitlines()[-1])
+            for stage in STAGES:
+                timings[stage].append((report['stages'][stage] - started) * 1000)
+            self.stdout.write(
+                f"run {run + 1}: {report['status']} in {timings['response'][-1]:.0f} ms"
+            )
+
+        self.stdout.write(f"{'median ms':>10} {'min ms':>8}  stage (since process start)")
+        for stage in STAGES:
+            self.stdout.write(
+                f"{statistics.median(timings[stage]):10.0f} {min(timings[stage]):8.0f}  {stage}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Median time to first response: {statistics.median(timings['response']):.0f} ms "
+            f"over {options['runs']} runs"
+        ))
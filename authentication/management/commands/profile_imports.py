@@ -0,0 +1,69 @@
+# authentication/management/commands/profile_imports.py
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+# What a fresh worker imports before it can serve: settings, apps, the WSGI
+# handler and the URLconf (and through it every view module)
+STARTUP = (
+    "from django.core.wsgi import get_wsgi_application; "
+    "get_wsgi_application(); "
+    "from django.urls import get_resolver; "
+    "get_resolver().url_patterns"
+)
+
+
+def parse_importtime(output):
+    """
+    Parse ``python -X importtime`` output into a list of
+    (module, self microseconds, cumulative microseconds, depth).
+    """
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+class Command(BaseCommand):
+    help = "Profile the imports a fresh worker does at startup (python -X importtime)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=25, help="Number of modules to list")
+        parser.add_argument('--packages', action='store_true',
+                            help="Group self time by top-level package instead of listing modules")
+
+    def handle(self, *args, **options):
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', STARTUP],
+            capture_output=True, text=True,
+        )
+        if result.returncode != 0:
+            self.stderr.write(result.stderr)
+            return
+        modules = parse_importtime(result.stderr)
+        total = sum(self_us for _, self_us, _, _ in modules)
+
+        if options['packages']:
+            per_package = defaultdict(int)
+            for name, self_us, _, _ in modules:
+                per_package[name.split('.')[0]] += self_us
+            rows = sorted(per_package.items(), key=lambda item: item[1], reverse=True)
+            self.stdout.write(f"{'self ms':>9}  package")
+            for package, self_us in rows[:options['top']]:
+                self.stdout.write(f"{self_us / 1000:9.1f}  {package}")
+        else:
+            # Top-level imports by cumulative time, i.e. what each import statement cost
+            rows = sorted(modules, key=lambda module: module[2], reverse=True)
+            self.stdout.write(f"{'cum ms':>9} {'self ms':>9}  module")
+            for name, self_us, cumulative_us, depth in rows[:options['top']]:
+                self.stdout.write(f"{cumulative_us / 1000:9.1f} {self_us / 1000:9.1f}  {'  ' * depth}{name}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(modules)} modules imported in {total / 1000:.1f} ms"
+        ))
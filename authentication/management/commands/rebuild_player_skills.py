@@ -0,0 +1,12 @@
+# authentication/management/commands/rebuild_player_skills.py
+from django.core.management.base import BaseCommand
+
+from authentication.skill import rebuild_player_skills
+
+
+class Command(BaseCommand):
+    help = "Recompute every player's overall skill (PlayerSkill) from GameScore"
+
+    def handle(self, *args, **options):
+        written = rebuild_player_skills()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt overall skill for {written} players"))
@@ -0,0 +1,12 @@
+# authentication/management/commands/rebuild_score_histograms.py
+from django.core.management.base import BaseCommand
+
+from authentication.histograms import rebuild_histograms
+
+
+class Command(BaseCommand):
+    help = "Recompute the per-config score histograms (ScoreBucket) from GameScore"
+
+    def handle(self, *args, **options):
+        written = rebuild_histograms()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {written} score buckets"))
@@ -0,0 +1,63 @@
+# authentication/management/commands/run_background_tasks.py
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F
+
+from authentication.models import BackgroundTask
+from authentication.tasks import registry, chunks, execute
+
+
+class Command(BaseCommand):
+    help = "Run durable background tasks queued in the BackgroundTask table"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Process a single batch and exit")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--sleep', type=float, default=1.0, help="Seconds to wait when the queue is empty")
+        parser.add_argument('--max-attempts', type=int, default=5)
+
+    def handle(self, *args, **options):
+        while True:
+            processed = self.process_batch(options['batch_size'], options['max_attempts'])
+            if processed:
+                self.stdout.write(f"Processed {processed} tasks")
+            if options['once']:
+                return
+            if not processed:
+                time.sleep(options['sleep'])
+
+    def process_batch(self, batch_size, max_attempts):
+        with transaction.atomic():
+            # skip_locked lets several workers share the queue
+            tasks = list(
+                BackgroundTask.objects.select_for_update(skip_locked=True)
+                .filter(attempts__lt=max_attempts)[:batch_size]
+            )
+            by_name = defaultdict(list)
+            for task in tasks:
+                by_name[task.name].append(task)
+
+            done, failed = [], {}
+            for name, rows in by_name.items():
+                if name not in registry:
+                    failed.update((row.pk, f"Unknown task {name}") for row in rows)
+                    continue
+                # chunks() groups argument tuples; keep the rows aligned with them
+                row_iter = iter(rows)
+                for chunk in chunks(name, [tuple(row.args) for row in rows]):
+                    chunk_rows = [next(row_iter) for _ in chunk]
+                    try:
+                        with transaction.atomic():
+                            execute(name, chunk)
+                        done.extend(row.pk for row in chunk_rows)
+                    except Exception as e:
+                        self.stderr.write(f"Task {name} failed: {str(e)}")
+                        failed.update((row.pk, str(e)) for row in chunk_rows)
+
+            BackgroundTask.objects.filter(pk__in=done).delete()
+            for pk, error in failed.items():
+                BackgroundTask.objects.filter(pk=pk).update(attempts=F('attempts') + 1, last_error=error)
+        return len(tasks)
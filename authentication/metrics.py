@@ -0,0 +1,93 @@
+# authentication/metrics.py
+"""
+Prometheus metrics, exposed at ``/metrics``.
+
+Each process aggregates its own metrics in memory. Under gunicorn, set
+``PROMETHEUS_MULTIPROC_DIR`` to an empty directory shared by the workers (and
+wipe it on deploy): every worker then writes its values to its own mmap'd
+file, and whichever worker serves ``/metrics`` merges them, so nothing is
+shared or locked between workers on the request path. ``child_exit`` (wired
+up in ``gunicorn.conf.py``) retires a worker's live gauges when it exits, however
+it exits.
+
+If ``METRICS_TOKEN`` is set, scrapers must send ``Authorization: Bearer <token>``.
+"""
+import os
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from prometheus_client import (
+    CollectorRegistry, Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest,
+)
+from prometheus_client import multiprocess
+
+REQUESTS = Counter(
+    'fretszy_http_requests_total', 'HTTP requests by view, method and status',
+    ['view', 'method', 'status'],
+)
+REQUEST_LATENCY = Histogram(
+    'fretszy_http_request_duration_seconds', 'Request latency by view', ['view'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+)
+DB_QUERIES = Histogram(
+    'fretszy_db_queries_per_request', 'Database queries per request by view', ['view'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+DB_TIME = Histogram(
+    'fretszy_db_time_seconds', 'Database time per request by view', ['view'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+QUERY_BUDGET_VIOLATIONS = Counter(
+    'fretszy_query_budget_violations_total', 'Requests over their query budget', ['view'],
+)
+CACHE_LOOKUPS = Counter(
+    'fretszy_cache_lookups_total', 'Read-through cache lookups by cache and result (hit/stale/miss)',
+    ['cache', 'result'],
+)
+RATE_LIMITED = Counter(
+    'fretszy_rate_limited_total', 'Requests rejected by the token-bucket rate limiter', ['scope'],
+)
+REQUESTS_SHED = Counter(
+    'fretszy_requests_shed_total', 'Requests rejected with 503 by admission control', ['priority'],
+)
+BACKGROUND_QUEUE_DEPTH = Gauge(
+    'fretszy_background_queue_depth', 'Calls waiting in the in-process background task queue',
+    multiprocess_mode='livesum',
+)
+BACKGROUND_TASKS = Counter(
+    'fretszy_background_tasks_total', 'Background task runs by task and outcome (ok/error/inline)',
+    ['task', 'outcome'],
+)
+LOGINS = Counter(
+    'fretszy_logins_total', 'Login attempts by provider and outcome', ['provider', 'outcome'],
+)
+IDEMPOTENCY = Counter(
+    'fretszy_idempotency_keys_total', 'Idempotency-Key requests by view and outcome (stored/replayed/conflict/mismatch)',
+    ['scope', 'outcome'],
+)
+SCORE_SUBMISSIONS = Counter(
+    'fretszy_score_submissions_total', 'Score submissions by outcome (created/improved/kept/invalid)',
+    ['outcome'],
+)
+
+
+def child_exit(server, worker):
+    """Gunicorn server hook: drop the ``livesum`` gauge files of an exited worker"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(worker.pid)
+
+
+def _registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_view(request):
+    """Prometheus text exposition of all metrics"""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return HttpResponseForbidden()
+    return HttpResponse(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
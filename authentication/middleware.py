@@ -1,18 +1,217 @@
 # authentication/middleware.py
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.http import JsonResponse
 from django.utils import timezone
+from whitenoise.middleware import WhiteNoiseMiddleware as BaseWhiteNoiseMiddleware
+
+from .query_budgets import QueryRecorder, enforce_budget
+from .metrics import REQUESTS, REQUEST_LATENCY, DB_QUERIES, DB_TIME, REQUESTS_SHED
+from .admission import (
+    AdmissionController, request_priority, upstream_queue_seconds, queue_budget, PRIORITY_NAMES
+)
+from .profiling import profile_requested, is_admin, run_profiled
+from .tasks import enqueue
+
+class AsyncCapableMiddleware:
+    """
+    Base for middleware that runs natively under both WSGI and ASGI.
+
+    Django keeps an ASGI request on the event loop only if every middleware
+    is async-capable; a sync-only one moves it, and everything it wraps, onto
+    a thread for the whole request. Subclasses implement ``handle`` and
+    ``ahandle``.
+    """
+    sync_capable = True
+    async_capable = True
 
-class UpdateLastActivityMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.ahandle(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        return self.get_response(request)
+
+    async def ahandle(self, request):
+        return await self.get_response(request)
+
+class WhiteNoiseMiddleware(BaseWhiteNoiseMiddleware):
+    """WhiteNoise 6 is sync-only; this serves the same files without leaving the event loop under ASGI"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
 
     def __call__(self, request):
+        if self.async_mode:
+            return self.ahandle(request)
+        return super().__call__(request)
+
+    async def ahandle(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            # Opens and stats the file
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+class UpdateLastActivityMiddleware(AsyncCapableMiddleware):
+    def handle(self, request):
         response = self.get_response(request)
-        
-        # Update last_login for authenticated users
+        self.touch(request)
+        return response
+
+    async def ahandle(self, request):
+        response = await self.get_response(request)
+        # request.user may still be a lazy session lookup, and enqueue() can run the task inline
+        await sync_to_async(self.touch)(request)
+        return response
+
+    def touch(self, request):
+        # Update last_login for authenticated users (off the request path)
         if request.user.is_authenticated:
-            # Using update to avoid triggering signal handlers
-            request.user.__class__.objects.filter(pk=request.user.pk).update(
-                last_login=timezone.now()
-            )
-            
-        return response
\ No newline at end of file
+            now = timezone.now().timestamp()
+            enqueue('touch_last_login', request.user.pk, now)
+            session_key = request.session.session_key if hasattr(request, 'session') else None
+            if session_key:
+                enqueue('touch_user_session', session_key, now)
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """Count requests and record latency and DB usage per view (see metrics.py)"""
+    def handle(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - start)
+        return response
+
+    async def ahandle(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = (match.url_name or match.view_name) if match else 'unmatched'
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+        REQUEST_LATENCY.labels(view).observe(elapsed)
+        recorder = getattr(request, 'query_recorder', None)
+        if recorder is not None:
+            DB_QUERIES.labels(view).observe(recorder.count)
+            DB_TIME.labels(view).observe(recorder.duration)
+
+class AdmissionControlMiddleware(AsyncCapableMiddleware):
+    """Limit in-flight requests per worker and shed what can't be served in time (see admission.py)"""
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.controller = AdmissionController(getattr(settings, 'ADMISSION_MAX_IN_FLIGHT', 16))
+
+    def handle(self, request):
+        priority = request_priority(request)
+        budget = queue_budget(priority) - upstream_queue_seconds(request)
+        if budget <= 0 or not self.controller.acquire(priority, budget):
+            return self.shed(priority)
+        try:
+            return self.get_response(request)
+        finally:
+            self.controller.release()
+
+    async def ahandle(self, request):
+        priority = request_priority(request)
+        budget = queue_budget(priority) - upstream_queue_seconds(request)
+        if budget <= 0 or not await self.controller.aacquire(priority, budget):
+            return self.shed(priority)
+        try:
+            return await self.get_response(request)
+        finally:
+            self.controller.release()
+
+    def shed(self, priority):
+        REQUESTS_SHED.labels(PRIORITY_NAMES[priority]).inc()
+        response = JsonResponse({'detail': 'Server is overloaded, please retry.'}, status=503)
+        response['Retry-After'] = str(getattr(settings, 'ADMISSION_RETRY_AFTER', 2))
+        return response
+
+class QueryBudgetMiddleware(AsyncCapableMiddleware):
+    """Measure DB queries per request (for MetricsMiddleware) and enforce the view's query budget"""
+    def handle(self, request):
+        recorder = request.query_recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        self.enforce(request, recorder)
+        return response
+
+    async def ahandle(self, request):
+        recorder = request.query_recorder = QueryRecorder()
+        # Connections are per thread: install the wrapper on the one this request's
+        # sync_to_async() calls (ORM, sync views) run in, not the event loop's
+        await sync_to_async(lambda: connection.execute_wrappers.append(recorder))()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(lambda: connection.execute_wrappers.remove(recorder))()
+        self.enforce(request, recorder)
+        return response
+
+    def enforce(self, request, recorder):
+        mode = getattr(settings, 'QUERY_BUDGET_MODE', 'log')
+        match = getattr(request, 'resolver_match', None)
+        if match is not None and mode != 'off':
+            enforce_budget(match.url_name, recorder, mode)
+
+class ProfilingMiddleware(AsyncCapableMiddleware):
+    """Profile the view on staff request or by random sampling (see profiling.py)"""
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if self.async_mode:
+            # Django adapts process_view to the handler's mode by checking for a coroutine
+            self.process_view = self.aprocess_view
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if iscoroutinefunction(view_func):
+            # Async views can't be called from here; they are not profiled
+            return None
+        requested = profile_requested(request)
+        if not requested and not self.sampled():
+            return None
+        return self.profile(request, requested, view_func, view_args, view_kwargs)
+
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        if iscoroutinefunction(view_func):
+            return None
+        # Decided on the event loop so unprofiled requests don't pay for a thread hop
+        requested = profile_requested(request)
+        if not requested and not self.sampled():
+            return None
+        return await sync_to_async(self.profile)(request, requested, view_func, view_args, view_kwargs)
+
+    @staticmethod
+    def sampled():
+        sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0)
+        return bool(sample_rate) and random.random() < sample_rate
+
+    @staticmethod
+    def profile(request, requested, view_func, view_args, view_kwargs):
+        if requested and not is_admin(request):
+            return None
+        response, profile_name = run_profiled(request, view_func, view_args, view_kwargs)
+        if profile_name and requested:
+            response['X-Profile-Id'] = profile_name
+        return response
@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-19 11:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0004_gamescore"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ScoreBucket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "game_type",
+                    models.CharField(
+                        choices=[("fretboard", "Fretboard Note Finder")], max_length=50
+                    ),
+                ),
+                ("fret_length", models.IntegerField(default=12)),
+                ("start_string", models.IntegerField(default=6)),
+                ("end_string", models.IntegerField(default=1)),
+                ("bucket", models.IntegerField()),
+                ("count", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=(
+                            "game_type",
+                            "fret_length",
+                            "start_string",
+                            "end_string",
+                            "bucket",
+                        ),
+                        name="unique_score_bucket",
+                    )
+                ],
+            },
+        ),
+    ]
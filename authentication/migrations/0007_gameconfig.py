@@ -0,0 +1,152 @@
+# Generated by Django 5.2 on 2026-10-19 12:20
+
+import hashlib
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def game_config_key(game_type, params):
+    # Frozen copy of authentication.models.game_config_key
+    canonical = json.dumps(
+        {"game_type": game_type, **params}, sort_keys=True, separators=(",", ":")
+    )
+    digest = hashlib.blake2b(canonical.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+def assign_config_keys(apps, schema_editor):
+    GameConfig = apps.get_model("authentication", "GameConfig")
+    GameScore = apps.get_model("authentication", "GameScore")
+    ScoreBucket = apps.get_model("authentication", "ScoreBucket")
+
+    for model in (GameScore, ScoreBucket):
+        # order_by() drops Meta.ordering, which would otherwise be added to the
+        # DISTINCT and yield one row per score instead of one per config
+        configs = (
+            model.objects.values_list(
+                "game_type", "fret_length", "start_string", "end_string"
+            )
+            .order_by()
+            .distinct()
+        )
+        for game_type, fret_length, start_string, end_string in configs:
+            params = {
+                "fret_length": fret_length,
+                "start_string": start_string,
+                "end_string": end_string,
+            }
+            key = game_config_key(game_type, params)
+            GameConfig.objects.get_or_create(
+                key=key, defaults={"game_type": game_type, "params": params}
+            )
+            model.objects.filter(
+                game_type=game_type,
+                fret_length=fret_length,
+                start_string=start_string,
+                end_string=end_string,
+            ).update(config_id=key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0006_backgroundtask"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="GameConfig",
+            fields=[
+                ("key", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("game_type", models.CharField(max_length=50)),
+                ("params", models.JSONField(default=dict)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="gamescore",
+            name="config",
+            field=models.ForeignKey(
+                db_column="config_key",
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="scores",
+                to="authentication.gameconfig",
+            ),
+        ),
+        migrations.AddField(
+            model_name="scorebucket",
+            name="config",
+            field=models.ForeignKey(
+                db_column="config_key",
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="score_buckets",
+                to="authentication.gameconfig",
+            ),
+        ),
+        migrations.RunPython(assign_config_keys, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="gamescore",
+            name="config",
+            field=models.ForeignKey(
+                db_column="config_key",
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="scores",
+                to="authentication.gameconfig",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="scorebucket",
+            name="config",
+            field=models.ForeignKey(
+                db_column="config_key",
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="score_buckets",
+                to="authentication.gameconfig",
+            ),
+        ),
+        migrations.RemoveConstraint(
+            model_name="gamescore",
+            name="unique_game_config",
+        ),
+        migrations.AddConstraint(
+            model_name="gamescore",
+            constraint=models.UniqueConstraint(
+                fields=("user", "config"), name="unique_user_game_config"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="gamescore",
+            index=models.Index(
+                fields=["config", "-score"], name="gamescore_config_score"
+            ),
+        ),
+        migrations.RemoveConstraint(
+            model_name="scorebucket",
+            name="unique_score_bucket",
+        ),
+        migrations.AddConstraint(
+            model_name="scorebucket",
+            constraint=models.UniqueConstraint(
+                fields=("config", "bucket"), name="unique_config_score_bucket"
+            ),
+        ),
+        migrations.RemoveField(
+            model_name="scorebucket",
+            name="end_string",
+        ),
+        migrations.RemoveField(
+            model_name="scorebucket",
+            name="fret_length",
+        ),
+        migrations.RemoveField(
+            model_name="scorebucket",
+            name="game_type",
+        ),
+        migrations.RemoveField(
+            model_name="scorebucket",
+            name="start_string",
+        ),
+    ]
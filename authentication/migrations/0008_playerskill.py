@@ -0,0 +1,62 @@
+# Generated by Django 5.2 on 2026-10-19 12:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def populate_player_skills(apps, schema_editor):
+    GameScore = apps.get_model("authentication", "GameScore")
+    PlayerSkill = apps.get_model("authentication", "PlayerSkill")
+    totals = (
+        GameScore.objects.values("user_id")
+        .annotate(total_score=Sum("score"), configs_played=Count("id"))
+        .order_by()
+    )
+    PlayerSkill.objects.bulk_create(
+        [
+            PlayerSkill(
+                user_id=row["user_id"],
+                total_score=row["total_score"],
+                configs_played=row["configs_played"],
+            )
+            for row in totals
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0007_gameconfig"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlayerSkill",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="skill",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("total_score", models.BigIntegerField(default=0)),
+                ("configs_played", models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["-total_score"], name="playerskill_total_score"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(populate_player_skills, migrations.RunPython.noop),
+    ]
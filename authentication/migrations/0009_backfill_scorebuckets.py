@@ -0,0 +1,39 @@
+# Generated by Django 5.2 on 2026-10-19 14:05
+
+from collections import Counter
+
+from django.conf import settings
+from django.db import migrations
+
+
+def populate_score_buckets(apps, schema_editor):
+    # Same as histograms.rebuild_histograms(). 0005 created the table empty,
+    # which left every percentile at 0 players until the command was run.
+    GameScore = apps.get_model("authentication", "GameScore")
+    ScoreBucket = apps.get_model("authentication", "ScoreBucket")
+    width = max(1, getattr(settings, "SCORE_HISTOGRAM_BUCKET_WIDTH", 5))
+    counts = Counter(
+        (config_id, score // width)
+        for config_id, score in GameScore.objects.values_list(
+            "config_id", "score"
+        ).iterator()
+    )
+    ScoreBucket.objects.all().delete()
+    ScoreBucket.objects.bulk_create(
+        [
+            ScoreBucket(config_id=config_id, bucket=bucket, count=count)
+            for (config_id, bucket), count in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("authentication", "0008_playerskill"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_score_buckets, migrations.RunPython.noop),
+    ]
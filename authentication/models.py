@@ -1,4 +1,7 @@
 # authentication/models.py
+import hashlib
+import json
+
 from django.db import models
 from django.contrib.auth.models import AbstractUser
 from django.utils.translation import gettext_lazy as _
@@ -15,6 +18,71 @@ class User(AbstractUser):
     def __str__(self):
         return self.email
 
+def game_config_key(game_type, params):
+    """
+    Compact fixed-width key for a game configuration: the first 8 bytes of the
+    BLAKE2b hash of its canonical JSON, as a signed 64-bit integer.
+    """
+    canonical = json.dumps({'game_type': game_type, **params}, sort_keys=True, separators=(',', ':'))
+    digest = hashlib.blake2b(canonical.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+def fretboard_params(fret_length, start_string, end_string):
+    return {'fret_length': int(fret_length), 'start_string': int(start_string), 'end_string': int(end_string)}
+
+# Builds the params dict a game type's configurations are keyed on from a
+# mapping of its settings (request data, or a score's field values). A new
+# game type registers a builder here instead of adding columns.
+GAME_CONFIG_PARAMS = {
+    'fretboard': lambda values: fretboard_params(
+        values.get('fret_length', 12), values.get('start_string', 6), values.get('end_string', 1)
+    ),
+}
+
+def game_config_params(game_type, values):
+    """Params dict for ``game_type`` from ``values``; ValueError for unknown game types"""
+    try:
+        builder = GAME_CONFIG_PARAMS[game_type]
+    except KeyError:
+        raise ValueError(f"Unknown game type: {game_type}")
+    return builder(values)
+
+def request_config_key(values):
+    """Key of the configuration described by request parameters; ValueError if invalid"""
+    game_type = values.get('game_type', 'fretboard')
+    return game_config_key(game_type, game_config_params(game_type, values))
+
+class GameConfig(models.Model):
+    """A game configuration, stored once and referenced by its hashed key"""
+    key = models.BigIntegerField(primary_key=True)
+    game_type = models.CharField(max_length=50)
+    params = models.JSONField(default=dict)
+    
+    # Keys known to exist in this process (rows are never modified). Cleared
+    # after migrate/flush and by tests, since a rollback can remove the rows.
+    _known_keys = set()
+    
+    def __str__(self):
+        return f"{self.game_type} {self.params}"
+    
+    @classmethod
+    def get_key(cls, game_type, params):
+        """Key for a configuration, creating its row on first use"""
+        key = game_config_key(game_type, params)
+        if key in cls._known_keys:
+            return key
+        config, created = cls.objects.get_or_create(
+            key=key, defaults={'game_type': game_type, 'params': params}
+        )
+        if config.game_type != game_type or config.params != params:
+            raise ValueError(f"Game config key collision: {config} vs {game_type} {params}")
+        cls._known_keys.add(key)
+        return key
+    
+    @classmethod
+    def forget_known_keys(cls):
+        cls._known_keys.clear()
+
 class GameScore(models.Model):
     """Model to store game scores for users"""
     GAME_TYPES = [
@@ -27,20 +95,82 @@ class GameScore(models.Model):
     score = models.IntegerField()
     date_achieved = models.DateTimeField(auto_now_add=True)
     
-    # Game configuration (for fretboard game)
+    # All lookups go through the hashed configuration key
+    config = models.ForeignKey(GameConfig, on_delete=models.PROTECT, db_column='config_key',
+                               related_name='scores')
+    
+    # Game configuration (for fretboard game), kept for display and the API
     fret_length = models.IntegerField(default=12)
     start_string = models.IntegerField(default=6)
     end_string = models.IntegerField(default=1)
     
     class Meta:
-        # Get the highest score for each user and game type
+        # Get the highest score for each user and game configuration
         constraints = [
             models.UniqueConstraint(
-                fields=['user', 'game_type', 'fret_length', 'start_string', 'end_string'],
-                name='unique_game_config'
+                fields=['user', 'config'],
+                name='unique_user_game_config'
             )
         ]
+        indexes = [
+            models.Index(fields=['config', '-score'], name='gamescore_config_score'),
+        ]
         ordering = ['-score', '-date_achieved']
     
     def __str__(self):
-        return f"{self.user.username} - {self.game_type} - {self.score}"
\ No newline at end of file
+        return f"{self.user.username} - {self.game_type} - {self.score}"
+    
+    def config_params(self):
+        return game_config_params(self.game_type, vars(self))
+    
+    def save(self, *args, **kwargs):
+        if self.config_id is None:
+            self.config_id = GameConfig.get_key(self.game_type, self.config_params())
+        super().save(*args, **kwargs)
+
+class BackgroundTask(models.Model):
+    """Durable queue entry for a background task (see tasks.py)"""
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    
+    class Meta:
+        ordering = ['id']
+    
+    def __str__(self):
+        return f"{self.name} ({self.attempts} attempts)"
+
+class ScoreBucket(models.Model):
+    """Number of players whose best score falls in one bucket of one game configuration"""
+    config = models.ForeignKey(GameConfig, on_delete=models.CASCADE, db_column='config_key',
+                               related_name='score_buckets')
+    
+    # Scores in [bucket * width, (bucket + 1) * width), width = SCORE_HISTOGRAM_BUCKET_WIDTH
+    bucket = models.IntegerField()
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['config', 'bucket'],
+                name='unique_config_score_bucket'
+            )
+        ]
+    
+    def __str__(self):
+        return f"{self.config_id} bucket {self.bucket}: {self.count}"
+class PlayerSkill(models.Model):
+    """A player's best scores summed across every game configuration (see skill.py)"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='skill')
+    total_score = models.BigIntegerField(default=0)
+    configs_played = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-total_score'], name='playerskill_total_score'),
+        ]
+    
+    def __str__(self):
+        return f"{self.user_id}: {self.total_score} over {self.configs_played} configs"
@@ -0,0 +1,82 @@
+# authentication/profiling.py
+"""
+On-demand view profiling.
+
+A request is profiled when a staff user (``IsAdminUser``) sends the
+``X-Profile`` header or ``?profile=1``, or when it is picked by random
+sampling at ``PROFILING_SAMPLE_RATE``. The view's call stack is captured with
+cProfile and written as a ``.prof`` (pstats) file into ``PROFILING_DIR``,
+keeping the newest ``PROFILING_MAX_FILES``. Inspect them with
+``python -m pstats`` or snakeviz.
+"""
+import cProfile
+import os
+import time
+import uuid
+
+from django.conf import settings
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import IsAdminUser
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+
+def profile_requested(request):
+    return 'HTTP_X_PROFILE' in request.META or request.GET.get('profile') == '1'
+
+
+def is_admin(request):
+    """Authenticate the request the way DRF views do and apply ``IsAdminUser``"""
+    drf_request = Request(request, authenticators=[
+        auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES
+    ])
+    try:
+        return IsAdminUser().has_permission(drf_request, None)
+    except APIException:
+        return False
+
+
+def _profile_dir():
+    return getattr(settings, 'PROFILING_DIR', settings.BASE_DIR / 'profiles')
+
+
+def _rotate(directory, keep):
+    profiles = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith('.prof')),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in profiles[:max(0, len(profiles) - keep)]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def run_profiled(request, view_func, view_args, view_kwargs):
+    """Call the view under cProfile; returns (response, profile file name or None)"""
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is already active in this process
+        return view_func(request, *view_args, **view_kwargs), None
+    try:
+        response = view_func(request, *view_args, **view_kwargs)
+    finally:
+        profiler.disable()
+
+    directory = _profile_dir()
+    name = "{}-{}-{}-{}.prof".format(
+        time.strftime('%Y%m%d-%H%M%S'),
+        getattr(request.resolver_match, 'url_name', None) or 'view',
+        os.getpid(),
+        uuid.uuid4().hex[:6],
+    )
+    try:
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(directory, name))
+        _rotate(directory, getattr(settings, 'PROFILING_MAX_FILES', 100))
+    except OSError as e:
+        print(f"Could not write profile {name}: {str(e)}")
+        return response, None
+    return response, name
@@ -0,0 +1,150 @@
+# authentication/query_budgets.py
+"""
+Per-view database query budgets.
+
+Every route in ``authentication/urls.py`` declares how many queries and how
+much DB time one request may use. ``QueryBudgetMiddleware`` measures each
+request and, depending on ``QUERY_BUDGET_MODE``:
+
+* ``'raise'`` - raises ``QueryBudgetExceeded`` (use in tests, see
+  ``enforce_query_budgets()``); only the query count is checked, since DB
+  time on a CI machine is too noisy to fail a test on,
+* ``'log'``   - logs a warning with a sample of the offending SQL and counts
+  the violation in ``violation_counts`` (production),
+* ``'off'``   - enforces nothing; queries are still recorded for the
+  per-view DB metrics.
+
+A system check warns about routes that have no budget.
+"""
+import logging
+import time
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.core.checks import Warning, register, Tags
+
+from .metrics import QUERY_BUDGET_VIOLATIONS
+from .tasks import running_task
+
+logger = logging.getLogger(__name__)
+
+QueryBudget = namedtuple('QueryBudget', ['max_queries', 'max_db_ms'])
+
+# Keyed by URL name. Query counts are the most a request was measured to use
+# in the test suite (QueryBudgetTests): token authentication included, savepoints
+# included (tests run inside a transaction), background tasks excluded even when
+# they run inline, since they are not part of the request path.
+BUDGETS = {
+    'google-login': QueryBudget(max_queries=7, max_db_ms=200),
+    'google-login-async': QueryBudget(max_queries=6, max_db_ms=200),
+    'register': QueryBudget(max_queries=9, max_db_ms=200),
+    'login': QueryBudget(max_queries=4, max_db_ms=200),
+    'logout': QueryBudget(max_queries=2, max_db_ms=100),
+    'user': QueryBudget(max_queries=1, max_db_ms=50),
+    'active-users': QueryBudget(max_queries=2, max_db_ms=100),
+    'game-scores': QueryBudget(max_queries=8, max_db_ms=200),
+    'leaderboard': QueryBudget(max_queries=2, max_db_ms=100),
+    'leaderboard-batch': QueryBudget(max_queries=2, max_db_ms=150),
+    'score-histogram': QueryBudget(max_queries=2, max_db_ms=50),
+    'score-percentile': QueryBudget(max_queries=3, max_db_ms=50),
+    'leaderboard-stream': QueryBudget(max_queries=1, max_db_ms=50),
+    'overall-leaderboard': QueryBudget(max_queries=2, max_db_ms=100),
+}
+
+# Violations per URL name since the worker started
+violation_counts = Counter()
+
+
+def enforce_query_budgets():
+    """
+    Test harness: decorator/context manager under which any request over its
+    budget raises ``QueryBudgetExceeded``, e.g. ``@enforce_query_budgets()``
+    on a ``TestCase``.
+    """
+    from django.test import override_settings
+
+    return override_settings(QUERY_BUDGET_MODE='raise')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` callable that counts and times queries"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+        self.slowest = (0.0, None)
+
+    def __call__(self, execute, sql, params, many, context):
+        if running_task.get() is not None:
+            # A background task that ran inline (tests, full queue): not the view's cost
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            self.statements[sql] += 1
+            if elapsed > self.slowest[0]:
+                self.slowest = (elapsed, sql)
+
+    @property
+    def duration_ms(self):
+        return self.duration * 1000
+
+    def sample(self):
+        """The most repeated statement (likely an N+1), else the slowest one"""
+        if not self.statements:
+            return None
+        sql, repeats = self.statements.most_common(1)[0]
+        if repeats > 1:
+            return f"{repeats}x {sql}"
+        return self.slowest[1]
+
+
+def check_budget(url_name, recorder, check_time=True):
+    """Return a description of the overrun, or None if within budget"""
+    budget = BUDGETS.get(url_name)
+    if budget is None:
+        return None
+    problems = []
+    if recorder.count > budget.max_queries:
+        problems.append(f"{recorder.count} queries (budget {budget.max_queries})")
+    if check_time and recorder.duration_ms > budget.max_db_ms:
+        problems.append(f"{recorder.duration_ms:.1f}ms DB time (budget {budget.max_db_ms}ms)")
+    if not problems:
+        return None
+    return f"Query budget exceeded for '{url_name}': {', '.join(problems)}; sample: {recorder.sample()}"
+
+
+def enforce_budget(url_name, recorder, mode=None):
+    mode = mode or getattr(settings, 'QUERY_BUDGET_MODE', 'log')
+    message = check_budget(url_name, recorder, check_time=mode != 'raise')
+    if message is None:
+        return
+    if mode == 'raise':
+        raise QueryBudgetExceeded(message)
+    violation_counts[url_name] += 1
+    QUERY_BUDGET_VIOLATIONS.labels(url_name).inc()
+    logger.warning(message)
+
+
+@register(Tags.urls)
+def check_routes_have_budgets(app_configs, **kwargs):
+    from .urls import urlpatterns
+
+    return [
+        Warning(
+            f"Route '{pattern.pattern}' has no query budget.",
+            hint="Add it to authentication.query_budgets.BUDGETS.",
+            id='authentication.W001',
+        )
+        for pattern in urlpatterns
+        if pattern.name not in BUDGETS
+    ]
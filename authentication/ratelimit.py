@@ -0,0 +1,80 @@
+# authentication/ratelimit.py
+"""
+Token-bucket rate limiting for logins, registration and score submission.
+
+Each client (user, else API token, else IP via ``get_client_ip``, which
+ignores X-Forwarded-For entries not added by a trusted proxy) gets a
+bucket per scope holding up to ``capacity`` tokens that refill at
+``refill_per_second``; a request spends one token or is rejected with 429.
+Policies live in ``settings.RATE_LIMITS``. Buckets are kept in the
+``RATE_LIMIT_CACHE`` cache alias (local memory by default, so a rejection
+costs a cache lookup and never touches the database).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from .signals import get_client_ip
+from .metrics import RATE_LIMITED
+
+
+def client_key(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    auth = request.META.get('HTTP_AUTHORIZATION', '')
+    if auth.startswith('Token '):
+        return "token:" + hashlib.sha1(auth.encode()).hexdigest()
+    return f"ip:{get_client_ip(request)}"
+
+
+def consume(scope, key, now=None):
+    """
+    Spend one token from ``key``'s bucket for ``scope``.
+    Returns (allowed, seconds until a token is available).
+    """
+    policy = getattr(settings, 'RATE_LIMITS', {}).get(scope)
+    if policy is None:
+        return True, 0.0
+    capacity = policy['capacity']
+    rate = policy['refill_per_second']
+    now = time.monotonic() if now is None else now
+
+    cache = caches[getattr(settings, 'RATE_LIMIT_CACHE', 'default')]
+    cache_key = f"ratelimit:{scope}:{key}"
+    tokens, updated = cache.get(cache_key) or (capacity, now)
+    tokens = min(capacity, tokens + (now - updated) * rate)
+
+    allowed = tokens >= 1
+    if allowed:
+        tokens -= 1
+    # An untouched bucket is full again after capacity / rate seconds
+    cache.set(cache_key, (tokens, now), int(capacity / rate) + 1)
+
+    if allowed:
+        return True, 0.0
+    RATE_LIMITED.labels(scope).inc()
+    return False, (1 - tokens) / rate
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    DRF throttle applying the ``throttle_scope`` policy of the view to unsafe
+    methods (reads are not limited).
+    """
+
+    def allow_request(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+        scope = getattr(view, 'throttle_scope', None)
+        if scope is None:
+            return True
+        allowed, self.retry_after = consume(scope, client_key(request))
+        return allowed
+
+    def wait(self):
+        return self.retry_after
@@ -0,0 +1,55 @@
+# authentication/renderers.py
+"""
+Compact response formats for bulk reads (leaderboards).
+
+Besides plain JSON (a list of objects, one per row), views using
+``TABULAR_RENDERERS`` can be asked for:
+
+- ``application/vnd.fretszy.columnar+json`` (``?format=columnar``)
+- ``application/msgpack`` (``?format=msgpack``)
+
+Both carry the rows column by column, ``{"score": [...], "username": [...]}``,
+so field names are sent once per table instead of once per row. ``table()``
+builds that straight from query result tuples.
+"""
+import msgpack
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.fretszy.columnar+json'
+    format = 'columnar'
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, use_bin_type=True, default=str)
+
+
+COLUMNAR_FORMATS = (ColumnarJSONRenderer.format, MessagePackRenderer.format)
+
+TABULAR_RENDERERS = list(api_settings.DEFAULT_RENDERER_CLASSES) + [ColumnarJSONRenderer, MessagePackRenderer]
+
+
+def wants_columns(request):
+    renderer = getattr(request, 'accepted_renderer', None)
+    return renderer is not None and renderer.format in COLUMNAR_FORMATS
+
+
+def table(request, fields, rows):
+    """
+    ``rows`` (tuples ordered like ``fields``) in the negotiated layout: one
+    array per field for the compact formats, else one object per row.
+    """
+    if not wants_columns(request):
+        return [dict(zip(fields, row)) for row in rows]
+    columns = list(zip(*rows)) if rows else [()] * len(fields)
+    return {field: list(column) for field, column in zip(fields, columns)}
@@ -49,4 +49,14 @@ class GameScoreSummarySerializer(serializers.ModelSerializer):
     
     class Meta:
         model = GameScore
-        fields = ['score', 'date_achieved', 'fret_length', 'start_string', 'end_string', 'username']
\ No newline at end of file
+        fields = ['score', 'date_achieved', 'fret_length', 'start_string', 'end_string', 'username']
+
+class LeaderboardConfigSerializer(serializers.Serializer):
+    game_type = serializers.ChoiceField(choices=GameScore.GAME_TYPES, default='fretboard')
+    fret_length = serializers.IntegerField(default=12)
+    start_string = serializers.IntegerField(default=6)
+    end_string = serializers.IntegerField(default=1)
+
+class BatchLeaderboardSerializer(serializers.Serializer):
+    configs = LeaderboardConfigSerializer(many=True, allow_empty=False, max_length=20)
+    limit = serializers.IntegerField(default=5, min_value=1, max_value=100)
\ No newline at end of file
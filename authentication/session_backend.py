@@ -0,0 +1,120 @@
+# authentication/session_backend.py
+"""
+Session engine with a cache in front of the database and lazy writes.
+
+Like ``django.contrib.sessions.backends.cached_db``, sessions are read from
+``SESSION_CACHE_ALIAS`` and only fall back to ``django_session`` on a miss.
+Unlike it, saving an existing session only updates the cache; the database
+row is written behind by the batched ``persist_session`` background task (one
+UPDATE per session, last write wins). New sessions are still inserted
+synchronously so key collisions are caught, and deletions (logout) go
+straight to both. If the row turns out to be gone when the write lands, the
+cached copy is dropped too rather than outliving the session.
+
+Multi-worker deployments should point ``SESSION_CACHE_ALIAS`` at a cache
+shared by every worker (Redis, Memcached) and set ``SESSION_CACHE_SHARED``.
+With the default per-process cache, a logout only clears the cache of the
+worker that handled it, so a cached session that carries a logged-in user is
+only trusted once its row has been seen to still exist (one indexed
+``EXISTS`` query; anonymous sessions are served from the cache alone). Other
+workers can still serve a session's previous data until their copy expires,
+so entries are kept for at most ``SESSION_CACHE_SECONDS`` rather than the
+session's full lifetime.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+from django.core.cache import caches
+from django.utils import timezone
+
+from .tasks import background_task, enqueue
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = 'authentication.session_backend'
+
+    def _cache_timeout(self, expiry=None):
+        return min(self.get_expiry_age(expiry=expiry), getattr(settings, 'SESSION_CACHE_SECONDS', 30))
+
+    async def _acache_timeout(self, expiry=None):
+        return min(await self.aget_expiry_age(expiry=expiry), getattr(settings, 'SESSION_CACHE_SECONDS', 30))
+
+    def _needs_db_check(self, data):
+        return '_auth_user_id' in data and not getattr(settings, 'SESSION_CACHE_SHARED', False)
+
+    def _live_rows(self):
+        return self.model.objects.filter(session_key=self.session_key, expire_date__gt=timezone.now())
+
+    def load(self):
+        try:
+            data = self._cache.get(self.cache_key)
+        except Exception:
+            # Invalid cache key; treat as a new session like cached_db does
+            data = None
+        if data is not None and self._needs_db_check(data) and not self._live_rows().exists():
+            # Logged out (or expired) through another worker's cache
+            self._cache.delete(self.cache_key)
+            self._session_key = None
+            return {}
+        if data is None:
+            s = self._get_session_from_db()
+            if not s:
+                return {}
+            data = self.decode(s.session_data)
+            self._cache.set(self.cache_key, data, self._cache_timeout(expiry=s.expire_date))
+        return data
+
+    async def aload(self):
+        try:
+            data = await self._cache.aget(await self.acache_key())
+        except Exception:
+            data = None
+        if data is not None and self._needs_db_check(data) and not await self._live_rows().aexists():
+            await self._cache.adelete(await self.acache_key())
+            self._session_key = None
+            return {}
+        if data is None:
+            s = await self._aget_session_from_db()
+            if not s:
+                return {}
+            data = self.decode(s.session_data)
+            await self._cache.aset(await self.acache_key(), data, await self._acache_timeout(expiry=s.expire_date))
+        return data
+
+    def save(self, must_create=False):
+        if must_create or self.session_key is None:
+            # New sessions are inserted now so a key collision is detected
+            return super().save(must_create)
+        data = self._get_session(no_load=must_create)
+        self._cache.set(self.cache_key, data, self._cache_timeout())
+        enqueue('persist_session', self.session_key, self.encode(data), self.get_expiry_date().timestamp())
+
+    async def asave(self, must_create=False):
+        if must_create or self.session_key is None:
+            return await super().asave(must_create)
+        data = await self._aget_session(no_load=must_create)
+        await self._cache.aset(await self.acache_key(), data, await self._acache_timeout())
+        expire_date = await self.aget_expiry_date()
+        # enqueue() may fall back to running the task inline, which needs a sync context
+        await sync_to_async(enqueue)('persist_session', self.session_key, self.encode(data), expire_date.timestamp())
+
+
+@background_task('persist_session', batch=True)
+def persist_sessions(items):
+    """Items are (session_key, encoded data, expiry timestamp); latest write per session wins"""
+    latest = {session_key: rest for session_key, *rest in items}
+    model = SessionStore.get_model_class()
+    deleted = []
+    for session_key, (session_data, expire_timestamp) in latest.items():
+        # update() rather than save(): a session deleted meanwhile (logout) stays deleted
+        updated = model.objects.filter(session_key=session_key).update(
+            session_data=session_data,
+            expire_date=datetime.fromtimestamp(expire_timestamp, tz=dt_timezone.utc),
+        )
+        if not updated:
+            deleted.append(SessionStore.cache_key_prefix + session_key)
+    if deleted:
+        # save() re-cached the data before the row was deleted
+        caches[settings.SESSION_CACHE_ALIAS].delete_many(deleted)
@@ -1,8 +1,15 @@
 # authentication/signals.py
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from django.contrib.auth.signals import user_logged_in, user_logged_out
 from django.contrib.sessions.models import Session
+from django.db.models.signals import post_migrate
 from django.dispatch import receiver
+from .models import GameConfig
 from .session_models import UserSession
+from .tasks import background_task, enqueue
 
 @receiver(user_logged_in)
 def user_logged_in_handler(sender, request, user, **kwargs):
@@ -10,17 +17,16 @@ def user_logged_in_handler(sender, request, user, **kwargs):
         return
     
     # Get or create a session for this user
-    UserSession.objects.update_or_create(
-        session_key=request.session.session_key,
-        defaults={
-            'user': user,
-            'ip_address': get_client_ip(request),
-            'user_agent': request.META.get('HTTP_USER_AGENT', '')
-        }
+    enqueue(
+        'record_user_session',
+        request.session.session_key,
+        user.pk,
+        get_client_ip(request),
+        request.META.get('HTTP_USER_AGENT', '')
     )
     
     # Clean up expired sessions
-    UserSession.remove_expired_sessions()
+    enqueue('remove_expired_sessions')
 
 @receiver(user_logged_out)
 def user_logged_out_handler(sender, request, user, **kwargs):
@@ -28,12 +34,67 @@ def user_logged_out_handler(sender, request, user, **kwargs):
         return
     
     # Delete the user session
-    UserSession.objects.filter(session_key=request.session.session_key).delete()
+    enqueue('end_user_session', request.session.session_key)
+
+@receiver(post_migrate)
+def forget_game_config_keys(sender, **kwargs):
+    # migrate and flush can drop GameConfig rows this process remembers
+    GameConfig.forget_known_keys()
 
 def get_client_ip(request):
+    # Each proxy appends the address it received the request from, so only the
+    # last TRUSTED_PROXY_COUNT entries are trustworthy; anything to their left
+    # was sent by the client and can be anything
+    trusted_proxies = getattr(settings, 'TRUSTED_PROXY_COUNT', 0)
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-    if x_forwarded_for:
-        ip = x_forwarded_for.split(',')[0]
-    else:
-        ip = request.META.get('REMOTE_ADDR')
-    return ip
\ No newline at end of file
+    if trusted_proxies and x_forwarded_for:
+        entries = [entry.strip() for entry in x_forwarded_for.split(',')]
+        return entries[-min(trusted_proxies, len(entries))]
+    return request.META.get('REMOTE_ADDR')
+
+@background_task('record_user_session', batch=True)
+def record_user_sessions(items):
+    # Last write wins for a session logged in twice within one batch
+    latest = {session_key: rest for session_key, *rest in items}
+    for session_key, (user_id, ip_address, user_agent) in latest.items():
+        UserSession.objects.update_or_create(
+            session_key=session_key,
+            defaults={
+                'user_id': user_id,
+                'ip_address': ip_address,
+                'user_agent': user_agent
+            }
+        )
+
+@background_task('touch_user_session', batch=True)
+def touch_user_sessions(items):
+    """Items are (session_key, unix timestamp); one UPDATE per session with its latest activity"""
+    latest = {}
+    for session_key, timestamp in items:
+        latest[session_key] = max(timestamp, latest.get(session_key, timestamp))
+    for session_key, timestamp in latest.items():
+        UserSession.objects.filter(session_key=session_key).update(
+            last_activity=datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+        )
+
+@background_task('end_user_session', batch=True)
+def end_user_sessions(items):
+    UserSession.objects.filter(session_key__in=[session_key for session_key, in items]).delete()
+
+@background_task('remove_expired_sessions', batch=True)
+def remove_expired_sessions(items):
+    # However many logins asked for it, one sweep is enough
+    UserSession.remove_expired_sessions()
+
+@background_task('touch_last_login', batch=True)
+def touch_last_login(items):
+    """Items are (user_id, unix timestamp); one UPDATE per user with their latest activity"""
+    latest = {}
+    for user_id, timestamp in items:
+        latest[user_id] = max(timestamp, latest.get(user_id, timestamp))
+    User = get_user_model()
+    for user_id, timestamp in latest.items():
+        # Using update to avoid triggering signal handlers
+        User.objects.filter(pk=user_id).update(
+            last_login=datetime.fromtimestamp(timestamp, tz=dt_timezone.utc)
+        )
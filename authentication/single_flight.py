@@ -0,0 +1,162 @@
+# authentication/single_flight.py
+"""
+Request coalescing for hot read paths.
+
+``SingleFlight.do(key, fn)`` runs ``fn`` once per key at a time; concurrent
+callers with the same key block on the in-flight call and share its result.
+
+``cached_single_flight`` layers that over the Django cache with
+stale-while-revalidate: once an entry goes stale, exactly one caller
+recomputes it and everyone else keeps getting the stale value. With
+``SINGLE_FLIGHT_CROSS_WORKER`` enabled (only useful with a shared cache
+backend) a cache-based lock extends that guarantee across gunicorn workers,
+so a cache miss never turns into a stampede on the database.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .metrics import CACHE_LOOKUPS
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Deduplicate concurrent calls with the same key within this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def in_flight(self, key):
+        return key in self._calls
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+
+group = SingleFlight()
+
+
+def _cross_worker(cross_worker):
+    if cross_worker is None:
+        return getattr(settings, 'SINGLE_FLIGHT_CROSS_WORKER', False)
+    return cross_worker
+
+
+def _lock_key(key):
+    return f"{key}:lock"
+
+
+def _acquire(cache, key):
+    return cache.add(_lock_key(key), 1, getattr(settings, 'SINGLE_FLIGHT_LOCK_SECONDS', 10))
+
+
+def _release(cache, key):
+    cache.delete(_lock_key(key))
+
+
+def _store(cache, key, value, ttl, stale_ttl):
+    cache.set(key, (value, time.time() + ttl), ttl + stale_ttl)
+    return value
+
+
+def _wait_for_entry(cache, key):
+    """Poll for another worker's result while it holds the lock"""
+    deadline = time.monotonic() + getattr(settings, 'SINGLE_FLIGHT_LOCK_SECONDS', 10)
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def cached_single_flight(key, fn, ttl, stale_ttl=0, cross_worker=None, using='default'):
+    """
+    Return ``fn()`` cached under ``key`` for ``ttl`` seconds, served stale for
+    up to ``stale_ttl`` more seconds while a single caller revalidates it.
+    ``using`` is the cache alias.
+    """
+    cache = caches[using]
+    cross_worker = _cross_worker(cross_worker)
+    cache_name = key.split(':', 1)[0]
+    entry = cache.get(key)
+
+    if entry is not None:
+        value, fresh_until = entry
+        if time.time() < fresh_until:
+            CACHE_LOOKUPS.labels(cache_name, 'hit').inc()
+            return value
+        CACHE_LOOKUPS.labels(cache_name, 'stale').inc()
+        # Stale: one caller revalidates, everyone else serves the stale value
+        if group.in_flight(key) or (cross_worker and not _acquire(cache, key)):
+            return value
+        try:
+            return group.do(key, lambda: _store(cache, key, fn(), ttl, stale_ttl))
+        finally:
+            if cross_worker:
+                _release(cache, key)
+
+    CACHE_LOOKUPS.labels(cache_name, 'miss').inc()
+
+    def load():
+        if cross_worker and not _acquire(cache, key):
+            entry = _wait_for_entry(cache, key)
+            if entry is not None:
+                return entry[0]
+            # The lock holder died or is very slow; compute it ourselves
+            return _store(cache, key, fn(), ttl, stale_ttl)
+        try:
+            return _store(cache, key, fn(), ttl, stale_ttl)
+        finally:
+            if cross_worker:
+                _release(cache, key)
+
+    return group.do(key, load)
+
+
+def write_through(key, update, ttl, stale_ttl=0, using='default'):
+    """Replace a cached value with ``update(value)``; does nothing on a miss"""
+    cache = caches[using]
+    entry = cache.get(key)
+    if entry is not None:
+        _store(cache, key, update(entry[0]), ttl, stale_ttl)
+
+
+def mark_stale(key, stale_ttl, using='default'):
+    """Keep serving the cached value but make the next read revalidate it"""
+    cache = caches[using]
+    entry = cache.get(key)
+    if entry is not None:
+        cache.set(key, (entry[0], 0), stale_ttl)
@@ -0,0 +1,78 @@
+# authentication/skill.py
+"""
+Overall skill: each player's best scores summed across every game
+configuration, for a global leaderboard.
+
+``GameScoreView.post`` applies the improvement (new best minus previous best)
+to the player's ``PlayerSkill`` row instead of re-aggregating ``GameScore``,
+and the leaderboard reads the top rows off the ``total_score`` index.
+``manage.py rebuild_player_skills`` recomputes the table from scratch if it
+ever drifts.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction, IntegrityError
+from django.db.models import Count, F, Sum
+
+from .models import GameScore, PlayerSkill
+from .single_flight import cached_single_flight
+from .tasks import background_task
+
+SKILL_FIELDS = ('username', 'total_score', 'configs_played')
+
+
+@background_task('record_skill_change', batch=True)
+def record_skill_changes(items):
+    """Apply (user_id, score delta, new configs) changes, one UPDATE per player"""
+    changes = defaultdict(lambda: [0, 0])
+    for user_id, delta, new_configs in items:
+        changes[user_id][0] += delta
+        changes[user_id][1] += new_configs
+    for user_id, (delta, new_configs) in changes.items():
+        players = PlayerSkill.objects.filter(user_id=user_id)
+        update = dict(total_score=F('total_score') + delta, configs_played=F('configs_played') + new_configs)
+        if players.update(**update):
+            continue
+        try:
+            with transaction.atomic():
+                PlayerSkill.objects.create(user_id=user_id, total_score=delta, configs_played=new_configs)
+        except IntegrityError:
+            # Created concurrently by another worker
+            players.update(**update)
+
+
+def fetch_skill_leaderboard(limit):
+    """Top players by overall skill as ``SKILL_FIELDS`` tuples"""
+    return list(PlayerSkill.objects.order_by('-total_score').values_list(
+        'user__username', 'total_score', 'configs_played'
+    )[:limit])
+
+
+def get_skill_leaderboard(limit):
+    limit = max(limit, 0)
+    depth = getattr(settings, 'LEADERBOARD_CACHE_DEPTH', 100)
+    if limit > depth:
+        return fetch_skill_leaderboard(limit)
+    entries = cached_single_flight(
+        'skill_leaderboard:top',
+        lambda: fetch_skill_leaderboard(depth),
+        ttl=getattr(settings, 'LEADERBOARD_CACHE_SECONDS', 10),
+        stale_ttl=getattr(settings, 'LEADERBOARD_STALE_SECONDS', 60),
+    )
+    return entries[:limit]
+
+
+def rebuild_player_skills():
+    """Recompute every player's overall skill from ``GameScore``; returns the number of players"""
+    totals = list(GameScore.objects.values('user_id').annotate(
+        total_score=Sum('score'), configs_played=Count('id')
+    ).order_by())
+    with transaction.atomic():
+        PlayerSkill.objects.all().delete()
+        PlayerSkill.objects.bulk_create([
+            PlayerSkill(user_id=row['user_id'], total_score=row['total_score'],
+                        configs_played=row['configs_played'])
+            for row in totals
+        ], batch_size=1000)
+    return len(totals)
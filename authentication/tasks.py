@@ -0,0 +1,166 @@
+# authentication/tasks.py
+"""
+Background execution of non-critical writes.
+
+Tasks are registered by name with ``@background_task``. ``enqueue(name,
+*args)`` hands one call to a bounded in-process queue drained by a daemon
+thread, which takes up to ``BACKGROUND_TASKS_BATCH_SIZE`` calls at a time and
+gives each batch task all of its pending calls at once (so e.g. a burst of
+``last_login`` touches becomes one UPDATE per user). When the queue is full
+the call runs inline instead of being dropped. The queue is drained on
+interpreter shutdown.
+
+Tasks named in ``BACKGROUND_TASKS_DURABLE`` are stored in the
+``BackgroundTask`` table instead and executed by
+``manage.py run_background_tasks``, so they survive worker restarts. Their
+arguments must be JSON-serializable.
+
+With ``BACKGROUND_TASKS_ENABLED = False`` everything runs inline.
+"""
+import atexit
+import contextvars
+import os
+import queue
+import threading
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .metrics import BACKGROUND_QUEUE_DEPTH, BACKGROUND_TASKS
+
+Task = namedtuple('Task', ['func', 'batch'])
+
+registry = {}
+
+# Name of the task being run, if any. Lets per-request query accounting
+# (query_budgets.QueryRecorder) leave out tasks that ran inline.
+running_task = contextvars.ContextVar('running_task', default=None)
+
+
+def background_task(name, batch=False):
+    """
+    Register a task. Batch tasks are called with a list of argument tuples,
+    one per ``enqueue`` call; plain tasks are called once per ``enqueue``.
+    """
+    def decorator(func):
+        registry[name] = Task(func, batch)
+        return func
+    return decorator
+
+
+def execute(name, items):
+    """Run task ``name`` for a list of argument tuples; raises on failure"""
+    task = registry[name]
+    if task.batch:
+        task.func(items)
+    else:
+        for args in items:
+            task.func(*args)
+
+
+def chunks(name, items):
+    """How calls are grouped per run: all at once for batch tasks, else one by one"""
+    return [items] if registry[name].batch else [[args] for args in items]
+
+
+def run_tasks(calls):
+    """Run (name, args) calls, logging and counting failures"""
+    grouped = defaultdict(list)
+    for name, args in calls:
+        grouped[name].append(args)
+    for name, items in grouped.items():
+        for chunk in chunks(name, items):
+            token = running_task.set(name)
+            try:
+                execute(name, chunk)
+                BACKGROUND_TASKS.labels(name, 'ok').inc()
+            except Exception as e:
+                BACKGROUND_TASKS.labels(name, 'error').inc()
+                print(f"Background task {name} failed: {str(e)}")
+            finally:
+                running_task.reset(token)
+
+
+class BackgroundExecutor:
+    """Bounded queue plus one daemon worker thread, started lazily per process"""
+
+    _STOP = object()
+
+    def __init__(self):
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+
+    def _ensure_started(self):
+        if self.pid == os.getpid() and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.pid == os.getpid() and self.thread.is_alive():
+                return
+            # First use, or we were forked from a process that had a worker
+            self.queue = queue.Queue(maxsize=getattr(settings, 'BACKGROUND_TASKS_QUEUE_SIZE', 1000))
+            self.thread = threading.Thread(target=self._work, name='background-tasks', daemon=True)
+            self.pid = os.getpid()
+            self.thread.start()
+
+    def submit(self, name, args):
+        self._ensure_started()
+        try:
+            self.queue.put_nowait((name, args))
+        except queue.Full:
+            BACKGROUND_TASKS.labels(name, 'inline').inc()
+            run_tasks([(name, args)])
+            return
+        BACKGROUND_QUEUE_DEPTH.set(self.queue.qsize())
+
+    def _work(self):
+        batch_size = getattr(settings, 'BACKGROUND_TASKS_BATCH_SIZE', 100)
+        while True:
+            calls = [self.queue.get()]
+            while len(calls) < batch_size:
+                try:
+                    calls.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            BACKGROUND_QUEUE_DEPTH.set(self.queue.qsize())
+
+            stop = self._STOP in calls
+            close_old_connections()
+            run_tasks([call for call in calls if call is not self._STOP])
+            for _ in calls:
+                self.queue.task_done()
+            if stop:
+                connection.close()
+                return
+            if self.queue.empty():
+                # Don't hold a DB connection open while idle
+                connection.close()
+
+    def shutdown(self, timeout=None):
+        """Run everything still queued, waiting up to ``timeout`` seconds"""
+        if self.thread is None or self.pid != os.getpid() or not self.thread.is_alive():
+            return
+        if timeout is None:
+            timeout = getattr(settings, 'BACKGROUND_TASKS_SHUTDOWN_TIMEOUT', 5)
+        try:
+            self.queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+
+
+executor = BackgroundExecutor()
+atexit.register(executor.shutdown)
+
+
+def enqueue(name, *args):
+    """Run task ``name`` with ``args`` off the request path"""
+    if name in getattr(settings, 'BACKGROUND_TASKS_DURABLE', ()):
+        from .models import BackgroundTask
+        BackgroundTask.objects.create(name=name, args=list(args))
+    elif getattr(settings, 'BACKGROUND_TASKS_ENABLED', True):
+        executor.submit(name, args)
+    else:
+        run_tasks([(name, args)])
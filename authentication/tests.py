@@ -1,3 +1,731 @@
-from django.test import TestCase
+import asyncio
+import importlib
+import io
+import json
+import threading
+from unittest import mock
 
-# Create your tests here.
+import msgpack
+from asgiref.sync import sync_to_async
+from django.apps import apps
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.cache import caches
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connection
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from .admission import AdmissionController, READ
+from .metrics import DB_QUERIES
+from .models import User, GameScore, GameConfig, ScoreBucket, PlayerSkill, BackgroundTask, GAME_CONFIG_PARAMS, game_config_key, fretboard_params
+from .query_budgets import BUDGETS, QueryRecorder, enforce_query_budgets
+from .leaderboard import fetch_top_rows, fetch_top_scores_batch
+from .leaderboard_stream import broker, _event_stream
+from .signals import get_client_ip
+from .tasks import BackgroundExecutor, Task, enqueue, registry, run_tasks
+from .views import _score_changed
+from .session_backend import SessionStore, persist_sessions
+
+
+@override_settings(BACKGROUND_TASKS_ENABLED=False, ALLOWED_HOSTS=['testserver'],
+                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class APITestCase(TestCase):
+    """Runs background tasks inline and starts every test with empty caches"""
+
+    def setUp(self):
+        for cache in caches.all():
+            cache.clear()
+        # Rows remembered by an earlier test were rolled back with it
+        GameConfig.forget_known_keys()
+        self.user = User.objects.create_user(username='player', email='player@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_score(self, score, user=None, **config):
+        if user is not None:
+            self.client.force_authenticate(user)
+        return self.client.post('/api/game-scores/', {'game_type': 'fretboard', 'score': score, **config},
+                                format='json')
+
+
+class GameConfigKeyTests(APITestCase):
+
+    def test_score_is_keyed_on_its_config(self):
+        response = self.post_score(10, fret_length=5)
+        self.assertEqual(response.status_code, 201)
+        game_score = GameScore.objects.get()
+        self.assertEqual(game_score.config_id, game_config_key('fretboard', fretboard_params(5, 6, 1)))
+        self.assertEqual(game_score.config.params, {'fret_length': 5, 'start_string': 6, 'end_string': 1})
+
+    def test_improving_a_score_updates_the_same_row(self):
+        self.post_score(10)
+        response = self.post_score(20)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(GameScore.objects.get().score, 20)
+
+    def test_unknown_game_type_is_rejected(self):
+        response = self.post_score(10, game_type='banjo')
+        self.assertEqual(response.status_code, 400)
+
+    def register_chords(self):
+        GAME_CONFIG_PARAMS['chords'] = lambda values: {'chord_set': values.get('chord_set', 'open')}
+        self.addCleanup(GAME_CONFIG_PARAMS.pop, 'chords')
+
+    def test_new_game_type_supplies_its_own_params(self):
+        self.register_chords()
+        game_score = GameScore.objects.create(user=self.user, game_type='chords', score=3)
+        self.assertEqual(game_score.config_id, game_config_key('chords', {'chord_set': 'open'}))
+
+    def test_new_game_type_is_read_under_the_key_it_was_written_with(self):
+        self.register_chords()
+        game_score = GameScore.objects.create(user=self.user, game_type='chords', score=7)
+        _score_changed(game_score)
+        query = {'game_type': 'chords', 'chord_set': 'open'}
+        self.assertEqual(self.client.get('/api/leaderboard/', query).data[0]['score'], 7)
+        self.assertEqual(self.client.get('/api/game-scores/', query).data['score'], 7)
+        self.assertEqual(self.client.get('/api/leaderboard/histogram/', query).data['total_players'], 1)
+        self.assertEqual(self.client.get('/api/leaderboard/percentile/', query).data['score'], 7)
+        self.assertEqual(self.client.get('/api/leaderboard/', {**query, 'chord_set': 'barre'}).data, [])
+        # The histogram task used the score's config rather than a fretboard one
+        self.assertEqual(list(GameConfig.objects.values_list('game_type', flat=True)), ['chords'])
+
+    def test_read_with_unknown_game_type_is_rejected(self):
+        self.assertEqual(self.client.get('/api/leaderboard/', {'game_type': 'banjo'}).status_code, 400)
+
+
+class BestScoreTests(APITestCase):
+
+    def test_best_score_defaults_for_first_time_players(self):
+        response = self.client.get('/api/game-scores/', {'current_score': 4})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['score'], 4)
+
+    def test_submission_writes_through_to_cached_best_score(self):
+        self.post_score(10)
+        self.assertEqual(self.client.get('/api/game-scores/').data['score'], 10)
+        self.post_score(25)
+        with CaptureQueriesContext(connection) as queries:
+            best = self.client.get('/api/game-scores/').data
+        # Only the (inline, in tests) last_login touch
+        self.assertFalse([q for q in queries.captured_queries if 'gamescore' in q['sql']])
+        self.assertEqual(best['score'], 25)
+        self.assertEqual(best['username'], 'player')
+
+    def test_percentile_defaults_to_the_players_best_score(self):
+        other = User.objects.create_user(username='other', email='other@example.com')
+        self.post_score(5, user=other)
+        self.post_score(40, user=self.user)
+        response = self.client.get('/api/leaderboard/percentile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['score'], 40)
+        self.assertEqual(response.data['total_players'], 2)
+
+    def test_percentile_without_a_best_score_uses_zero(self):
+        response = self.client.get('/api/leaderboard/percentile/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['score'], 0)
+
+
+@override_settings(SCORE_HISTOGRAM_BUCKET_WIDTH=5)
+class HistogramTests(APITestCase):
+
+    def buckets(self):
+        return dict(ScoreBucket.objects.filter(count__gt=0).values_list('bucket', 'count'))
+
+    def test_improvement_moves_the_player_between_buckets(self):
+        self.post_score(3)
+        self.assertEqual(self.buckets(), {0: 1})
+        self.post_score(12)
+        self.assertEqual(self.buckets(), {2: 1})
+        self.post_score(14)
+        self.assertEqual(self.buckets(), {2: 1})
+        other = User.objects.create_user(username='other', email='other@example.com')
+        self.post_score(1, user=other)
+        self.assertEqual(self.buckets(), {0: 1, 2: 1})
+        response = self.client.get('/api/leaderboard/histogram/')
+        self.assertEqual(response.data['total_players'], 2)
+        self.assertEqual(response.data['buckets'][1], {'min_score': 10, 'max_score': 14, 'count': 1})
+
+    def test_lower_score_leaves_the_histogram_alone(self):
+        self.post_score(12)
+        self.post_score(3)
+        self.assertEqual(self.buckets(), {2: 1})
+
+    def test_rebuild_command_recounts_from_scores(self):
+        for i, score in enumerate([3, 12, 13, 40]):
+            user = User.objects.create_user(username=f'p{i}', email=f'p{i}@example.com')
+            GameScore.objects.create(user=user, game_type='fretboard', score=score)
+        ScoreBucket.objects.create(config=GameScore.objects.first().config, bucket=99, count=5)
+        call_command('rebuild_score_histograms', stdout=io.StringIO())
+        self.assertEqual(self.buckets(), {0: 1, 2: 2, 8: 1})
+        self.assertEqual(self.client.get('/api/leaderboard/percentile/', {'score': 40}).data['total_players'], 4)
+
+    def test_migration_backfills_buckets_for_existing_scores(self):
+        for i, score in enumerate([3, 12]):
+            user = User.objects.create_user(username=f'p{i}', email=f'p{i}@example.com')
+            GameScore.objects.create(user=user, game_type='fretboard', score=score)
+        migration = importlib.import_module('authentication.migrations.0009_backfill_scorebuckets')
+        migration.populate_score_buckets(apps, None)
+        self.assertEqual(self.buckets(), {0: 1, 2: 1})
+
+
+class LeaderboardBatchTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        scores = {12: [5, 40, 25, 10], 5: [7, 3], 24: [50]}
+        for fret_length, board in scores.items():
+            for i, score in enumerate(board):
+                user, _ = User.objects.get_or_create(username=f'p{i}', email=f'p{i}@example.com')
+                GameScore.objects.create(user=user, game_type='fretboard', score=score, fret_length=fret_length)
+
+    def key(self, fret_length):
+        return game_config_key('fretboard', fretboard_params(fret_length, 6, 1))
+
+    def test_each_config_gets_its_top_rows_in_score_order(self):
+        keys = [self.key(12), self.key(5), self.key(24), self.key(7)]
+        with self.assertNumQueries(1):
+            boards = fetch_top_scores_batch(keys, 2)
+        self.assertEqual(list(boards), keys)
+        self.assertEqual([row[0] for row in boards[self.key(12)]], [40, 25])
+        self.assertEqual([row[0] for row in boards[self.key(5)]], [7, 3])
+        self.assertEqual([row[0] for row in boards[self.key(24)]], [50])
+        self.assertEqual(boards[self.key(7)], [])
+        for key in keys:
+            self.assertEqual(boards[key], fetch_top_rows(key, 2))
+
+    def test_duplicate_configs_are_collapsed(self):
+        response = self.client.post('/api/leaderboard/batch/', {'configs': [
+            {'fret_length': 12}, {'fret_length': 5}, {}, {'game_type': 'fretboard', 'start_string': 6},
+        ], 'limit': 3}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([board['fret_length'] for board in response.data], [12, 5])
+        self.assertEqual([entry['score'] for entry in response.data[0]['entries']], [40, 25, 10])
+        self.assertEqual([entry['score'] for entry in response.data[1]['entries']], [7, 3])
+
+
+class TabularRendererTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.other = User.objects.create_user(username='other', email='other@example.com')
+        self.post_score(20)
+        self.post_score(30, user=self.other)
+
+    def get_board(self, format, **config):
+        response = self.client.get('/api/leaderboard/', {'format': format, **config})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_columnar_json_sends_one_array_per_field(self):
+        response = self.get_board('columnar')
+        self.assertEqual(response['Content-Type'], 'application/vnd.fretszy.columnar+json')
+        board = json.loads(response.content)
+        self.assertEqual(set(board), {'score', 'date_achieved', 'fret_length', 'start_string', 'end_string', 'username'})
+        self.assertEqual(board['score'], [30, 20])
+        self.assertEqual(board['username'], ['other', 'player'])
+        self.assertEqual(board['fret_length'], [12, 12])
+
+    def test_msgpack_matches_columnar_json(self):
+        response = self.get_board('msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        board = msgpack.unpackb(response.content)
+        self.assertEqual(board['score'], [30, 20])
+        self.assertEqual(board['username'], ['other', 'player'])
+        self.assertEqual(len(board['date_achieved']), 2)
+
+    def test_empty_board_still_has_every_column(self):
+        for format, decode in (('columnar', json.loads), ('msgpack', msgpack.unpackb)):
+            board = decode(self.get_board(format, fret_length=5).content)
+            self.assertEqual(board, {
+                'score': [], 'date_achieved': [], 'fret_length': [],
+                'start_string': [], 'end_string': [], 'username': [],
+            })
+
+    def test_plain_json_keeps_one_object_per_row(self):
+        board = json.loads(self.get_board('json').content)
+        self.assertEqual([(row['username'], row['score']) for row in board], [('other', 30), ('player', 20)])
+
+    def test_batch_entries_use_the_negotiated_layout(self):
+        body = {'configs': [{}, {'fret_length': 5}], 'limit': 1}
+        for format, decode in (('columnar', json.loads), ('msgpack', msgpack.unpackb)):
+            response = self.client.post(f'/api/leaderboard/batch/?format={format}', body, format='json')
+            self.assertEqual(response.status_code, 200)
+            boards = decode(response.content)
+            self.assertEqual([board['fret_length'] for board in boards], [12, 5])
+            self.assertEqual(boards[0]['entries']['score'], [30])
+            self.assertEqual(boards[0]['entries']['username'], ['other'])
+            self.assertEqual(boards[1]['entries']['score'], [])
+
+    def test_overall_leaderboard_columns(self):
+        board = msgpack.unpackb(self.client.get('/api/leaderboard/overall/', {'format': 'msgpack'}).content)
+        self.assertEqual(board, {'username': ['other', 'player'], 'total_score': [30, 20], 'configs_played': [1, 1]})
+
+
+class PlayerSkillTests(APITestCase):
+
+    def skill(self, user=None):
+        player = PlayerSkill.objects.get(user=user or self.user)
+        return player.total_score, player.configs_played
+
+    def concurrently(self, score):
+        """Makes the view's first read of the player's score stale, as if another request improved it to ``score`` meanwhile"""
+        real_get = GameScore.objects.get
+
+        def stale_get(*args, **kwargs):
+            game_score = real_get(*args, **kwargs)
+            GameScore.objects.filter(pk=game_score.pk).update(score=score)
+            return game_score
+
+        return mock.patch.object(GameScore.objects, 'get', side_effect=stale_get)
+
+    def test_improvements_apply_deltas_and_count_configs_once(self):
+        self.post_score(10)
+        self.assertEqual(self.skill(), (10, 1))
+        self.post_score(25)
+        self.assertEqual(self.skill(), (25, 1))
+        self.post_score(20)
+        self.assertEqual(self.skill(), (25, 1))
+        self.post_score(5, start_string=2)
+        self.assertEqual(self.skill(), (30, 2))
+        self.assertEqual(self.skill(), (
+            sum(GameScore.objects.filter(user=self.user).values_list('score', flat=True)),
+            GameScore.objects.filter(user=self.user).count(),
+        ))
+
+    def test_concurrent_improvement_applies_delta_from_the_replaced_score(self):
+        self.post_score(30)
+        with self.concurrently(40), mock.patch('authentication.views.enqueue') as enqueue:
+            response = self.post_score(50)
+        self.assertEqual(response.data['score'], 50)
+        enqueue.assert_any_call('record_skill_change', self.user.id, 10, 0)
+        enqueue.assert_any_call('record_score_change', mock.ANY, 50, 40)
+
+    def test_concurrent_higher_score_is_kept(self):
+        self.post_score(30)
+        with self.concurrently(60), mock.patch('authentication.views.enqueue') as enqueue:
+            response = self.post_score(50)
+        self.assertEqual(response.data['score'], 60)
+        self.assertEqual(GameScore.objects.get(user=self.user).score, 60)
+        enqueue.assert_not_called()
+
+    def test_overall_leaderboard_orders_by_total_score(self):
+        other = User.objects.create_user(username='other', email='other@example.com')
+        third = User.objects.create_user(username='third', email='third@example.com')
+        self.post_score(20)
+        self.post_score(15, start_string=2)
+        self.post_score(50, user=other)
+        self.post_score(5, user=third)
+        response = self.client.get('/api/leaderboard/overall/', {'limit': 2})
+        self.assertEqual(response.data, [
+            {'username': 'other', 'total_score': 50, 'configs_played': 1},
+            {'username': 'player', 'total_score': 35, 'configs_played': 2},
+        ])
+
+
+class IdempotencyTests(APITestCase):
+
+    def register(self, email, key):
+        return APIClient().post('/api/auth/register/', {'email': email, 'password': 'long-enough'},
+                                format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_does_not_touch_the_database(self):
+        self.register('new@example.com', 'abc')
+        with self.assertNumQueries(0):
+            retry = self.register('new@example.com', 'abc')
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+
+    def test_add_is_atomic_across_processes(self):
+        cache = caches['idempotency']
+        self.assertTrue(cache.add('lock', 1, 30))
+        # Another process that checked for the key before this one wrote it
+        with mock.patch.object(cache, 'has_key', return_value=False):
+            self.assertFalse(cache.add('lock', 2, 30))
+        self.assertEqual(cache.get('lock'), 1)
+
+    def test_expired_entry_can_be_added_again(self):
+        cache = caches['idempotency']
+        cache.add('lock', 1, -1)
+        self.assertTrue(cache.add('lock', 2, 30))
+        self.assertEqual(cache.get('lock'), 2)
+
+    def test_retry_is_replayed_from_the_shared_cache(self):
+        first = self.register('new@example.com', 'abc')
+        retry = self.register('new@example.com', 'abc')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(User.objects.filter(email='new@example.com').count(), 1)
+
+    def test_key_reused_with_another_payload_is_rejected(self):
+        self.register('new@example.com', 'abc')
+        self.assertEqual(self.register('other@example.com', 'abc').status_code, 422)
+
+
+class RateLimitTests(APITestCase):
+
+    def login(self, forwarded_for, remote_addr='10.0.0.1'):
+        return APIClient().post('/api/auth/login/', {'email': 'player@example.com', 'password': 'wrong'},
+                                format='json', HTTP_X_FORWARDED_FOR=forwarded_for, REMOTE_ADDR=remote_addr)
+
+    def assert_throttled_after_capacity(self, forwarded_for):
+        for i in range(10):
+            self.assertEqual(self.login(forwarded_for(i)).status_code, 401)
+        response = self.login(forwarded_for(10))
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    def test_logins_are_limited_per_client(self):
+        self.assert_throttled_after_capacity(lambda i: '203.0.113.7')
+
+    def test_rotating_forwarded_for_does_not_escape_the_limit(self):
+        self.assert_throttled_after_capacity(lambda i: f'198.51.100.{i}')
+
+    @override_settings(TRUSTED_PROXY_COUNT=1)
+    def test_rotating_entries_before_the_trusted_proxy_do_not_escape_the_limit(self):
+        self.assert_throttled_after_capacity(lambda i: f'198.51.100.{i}, 203.0.113.7')
+
+    def test_client_ip_is_taken_from_the_trusted_proxy_hop(self):
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='1.1.1.1, 2.2.2.2, 3.3.3.3', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(get_client_ip(request), '10.0.0.1')
+        with self.settings(TRUSTED_PROXY_COUNT=1):
+            self.assertEqual(get_client_ip(request), '3.3.3.3')
+        with self.settings(TRUSTED_PROXY_COUNT=2):
+            self.assertEqual(get_client_ip(request), '2.2.2.2')
+
+
+class SessionStoreTests(APITestCase):
+
+    def test_saved_session_is_written_behind(self):
+        session = SessionStore()
+        session['step'] = 1
+        session.create()
+        session['step'] = 2
+        session.save()
+        self.assertEqual(SessionStore(session.session_key).load(), {'step': 2})
+        self.assertEqual(SessionStore.get_model_class().objects.get().get_decoded(), {'step': 2})
+
+    def test_write_to_a_deleted_session_drops_its_cached_copy(self):
+        session = SessionStore()
+        session['step'] = 1
+        session.create()
+        SessionStore.get_model_class().objects.all().delete()
+        persist_sessions([(session.session_key, session.encode({'step': 2}), session.get_expiry_date().timestamp())])
+        self.assertIsNone(caches['sessions'].get(session.cache_key))
+        self.assertEqual(SessionStore(session.session_key).load(), {})
+
+    def logged_in_session(self):
+        session = SessionStore()
+        session['_auth_user_id'] = str(self.user.pk)
+        session.create()
+        SessionStore(session.session_key).load()  # cached by this worker
+        return session
+
+    def test_logout_on_another_worker_revokes_cached_session(self):
+        session = self.logged_in_session()
+        # Another worker's logout deletes the row and only its own cached copy
+        SessionStore.get_model_class().objects.all().delete()
+        self.assertEqual(SessionStore(session.session_key).load(), {})
+        self.assertIsNone(caches['sessions'].get(session.cache_key))
+
+    async def test_async_load_revokes_cached_session(self):
+        session = await sync_to_async(self.logged_in_session)()
+        await SessionStore.get_model_class().objects.all().adelete()
+        self.assertEqual(await SessionStore(session.session_key).aload(), {})
+
+    def test_cached_anonymous_session_needs_no_query(self):
+        session = SessionStore()
+        session['step'] = 1
+        session.create()
+        SessionStore(session.session_key).load()
+        with self.assertNumQueries(0):
+            self.assertEqual(SessionStore(session.session_key).load(), {'step': 1})
+
+    @override_settings(SESSION_CACHE_SHARED=True)
+    def test_shared_cache_is_trusted(self):
+        session = self.logged_in_session()
+        with self.assertNumQueries(0):
+            self.assertEqual(SessionStore(session.session_key).load(), {'_auth_user_id': str(self.user.pk)})
+
+
+class BackgroundTaskTests(APITestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.calls = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+        def block():
+            self.started.set()
+            self.release.wait(5)
+
+        def record(*args):
+            self.calls.append(('record', args, threading.current_thread().name))
+
+        def record_batch(items):
+            self.calls.append(('record_batch', items, threading.current_thread().name))
+
+        def fail(*args):
+            raise ValueError('boom')
+
+        tasks = mock.patch.dict(registry, {
+            'test_block': Task(block, False),
+            'test_record': Task(record, False),
+            'test_record_batch': Task(record_batch, True),
+            'test_fail': Task(fail, False),
+        })
+        tasks.start()
+        self.addCleanup(tasks.stop)
+        self.executor = BackgroundExecutor()
+        self.addCleanup(self.release.set)
+
+    def start_blocked(self):
+        """Occupies the worker thread so later submissions wait in the queue"""
+        self.executor.submit('test_block', ())
+        self.assertTrue(self.started.wait(5))
+
+    def test_queued_calls_of_a_batch_task_run_together(self):
+        self.start_blocked()
+        for i in range(3):
+            self.executor.submit('test_record_batch', (i,))
+        self.executor.submit('test_record', ('plain',))
+        self.release.set()
+        self.executor.shutdown(timeout=5)
+        self.assertEqual(self.calls, [
+            ('record_batch', [(0,), (1,), (2,)], 'background-tasks'),
+            ('record', ('plain',), 'background-tasks'),
+        ])
+
+    @override_settings(BACKGROUND_TASKS_BATCH_SIZE=2)
+    def test_batches_are_capped_at_batch_size(self):
+        self.start_blocked()
+        for i in range(3):
+            self.executor.submit('test_record_batch', (i,))
+        self.release.set()
+        self.executor.shutdown(timeout=5)
+        self.assertEqual([items for _, items, _ in self.calls], [[(0,), (1,)], [(2,)]])
+
+    @override_settings(BACKGROUND_TASKS_QUEUE_SIZE=1)
+    def test_full_queue_runs_the_call_inline(self):
+        self.start_blocked()
+        self.executor.submit('test_record', ('queued',))
+        self.executor.submit('test_record', ('inline',))
+        self.assertEqual(self.calls, [('record', ('inline',), threading.current_thread().name)])
+        self.release.set()
+        self.executor.shutdown(timeout=5)
+        self.assertEqual(self.calls[1], ('record', ('queued',), 'background-tasks'))
+
+    def test_failing_task_does_not_stop_the_others(self):
+        run_tasks([('test_fail', ()), ('test_record', (1,))])
+        self.assertEqual(self.calls, [('record', (1,), threading.current_thread().name)])
+
+    def run_durable(self, *args):
+        call_command('run_background_tasks', '--once', *args, stdout=io.StringIO(), stderr=io.StringIO())
+
+    @override_settings(BACKGROUND_TASKS_DURABLE=['test_record_batch', 'test_fail'])
+    def test_durable_tasks_run_from_the_table(self):
+        enqueue('test_record_batch', 1, 'a')
+        enqueue('test_record_batch', 2, 'b')
+        self.assertEqual(self.calls, [])
+        self.run_durable()
+        self.assertEqual([items for _, items, _ in self.calls], [[(1, 'a'), (2, 'b')]])
+        self.assertFalse(BackgroundTask.objects.exists())
+
+    @override_settings(BACKGROUND_TASKS_DURABLE=['test_fail', 'test_record'])
+    def test_failed_durable_tasks_are_retried_until_max_attempts(self):
+        enqueue('test_fail', 1)
+        enqueue('test_record', 2)
+        BackgroundTask.objects.create(name='test_missing', args=[])
+        self.run_durable('--max-attempts', '2')
+        self.assertEqual(dict(BackgroundTask.objects.values_list('name', 'attempts')),
+                         {'test_fail': 1, 'test_missing': 1})
+        self.assertEqual(BackgroundTask.objects.get(name='test_fail').last_error, 'boom')
+        self.assertEqual(BackgroundTask.objects.get(name='test_missing').last_error, 'Unknown task test_missing')
+        self.run_durable('--max-attempts', '2')
+        self.run_durable('--max-attempts', '2')
+        self.assertEqual(BackgroundTask.objects.get(name='test_fail').attempts, 2)
+        self.assertEqual(len(self.calls), 1)
+
+    def test_durable_workers_skip_locked_rows(self):
+        with mock.patch.object(BackgroundTask.objects, 'select_for_update',
+                               wraps=BackgroundTask.objects.select_for_update) as select_for_update:
+            self.run_durable()
+        select_for_update.assert_called_once_with(skip_locked=True)
+
+
+@enforce_query_budgets()
+class QueryBudgetTests(APITestCase):
+    """Every budgeted route, exercised with token auth as clients use it"""
+
+    def setUp(self):
+        super().setUp()
+        self.user.set_password('correct-horse')
+        self.user.save()
+        self.client.force_authenticate(None)
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {self.token.key}")
+        others = [User.objects.create_user(username=f'p{i}', email=f'p{i}@example.com') for i in range(5)]
+        for i, other in enumerate(others):
+            GameScore.objects.create(user=other, game_type='fretboard', score=10 * i)
+            GameScore.objects.create(user=other, game_type='fretboard', score=i, fret_length=5)
+
+    def test_all_routes_are_covered(self):
+        tested = {name[len('test_'):].replace('_', '-') for name in dir(self) if name.startswith('test_')}
+        self.assertEqual(set(BUDGETS) - tested, set())
+
+    def google_idinfo(self, email):
+        return {'aud': settings.GOOGLE_OAUTH2_CLIENT_ID, 'iss': 'accounts.google.com', 'email': email,
+                'email_verified': True, 'given_name': 'Google', 'family_name': 'Player'}
+
+    def test_google_login(self):
+        self.assertEqual(self.client.post('/api/auth/google/', {}, format='json').status_code, 400)
+        # New user, then the same user again
+        for _ in range(2):
+            with mock.patch('google.oauth2.id_token.verify_oauth2_token',
+                            return_value=self.google_idinfo('google@example.com')):
+                response = self.client.post('/api/auth/google/', {'credential': 'jwt'}, format='json')
+            self.assertEqual(response.status_code, 200)
+
+    def test_google_login_async(self):
+        self.assertEqual(self.client.post('/api/auth/google/async/', {}, format='json').status_code, 400)
+        for _ in range(2):
+            with mock.patch('authentication.async_views.verify_google_credential',
+                            mock.AsyncMock(return_value=self.google_idinfo('google@example.com'))):
+                response = self.client.post('/api/auth/google/async/', {'credential': 'jwt'}, format='json')
+            self.assertEqual(response.status_code, 200)
+
+    def test_register(self):
+        response = self.client.post('/api/auth/register/', {'email': 'new@example.com', 'password': 'long-enough'},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_register_with_idempotency_key(self):
+        response = self.client.post('/api/auth/register/', {'email': 'new@example.com', 'password': 'long-enough'},
+                                    format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, 201)
+
+    def test_game_scores_with_idempotency_key(self):
+        response = self.client.post('/api/game-scores/', {'game_type': 'fretboard', 'score': 30},
+                                    format='json', HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, 201)
+
+    def test_login(self):
+        response = self.client.post('/api/auth/login/', {'email': 'player@example.com', 'password': 'correct-horse'},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_logout(self):
+        self.assertEqual(self.client.post('/api/auth/logout/').status_code, 200)
+
+    def test_user(self):
+        self.assertEqual(self.client.get('/api/auth/user/').status_code, 200)
+
+    def test_active_users(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.client.get('/api/auth/active-users/').status_code, 200)
+
+    def test_game_scores(self):
+        self.assertEqual(self.client.get('/api/game-scores/').status_code, 200)
+        self.assertEqual(self.post_score(30).status_code, 201)
+        self.assertEqual(self.post_score(40).status_code, 200)
+        self.assertEqual(self.post_score(35).status_code, 200)
+
+    def test_game_scores_on_a_new_config(self):
+        self.assertEqual(self.post_score(30, fret_length=7).status_code, 201)
+
+    def test_leaderboard(self):
+        self.assertEqual(len(self.client.get('/api/leaderboard/').data), 5)
+
+    def test_leaderboard_batch(self):
+        response = self.client.post('/api/leaderboard/batch/', {'configs': [{}, {'fret_length': 5}]}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_score_histogram(self):
+        self.assertEqual(self.client.get('/api/leaderboard/histogram/').status_code, 200)
+
+    def test_score_percentile(self):
+        self.assertEqual(self.client.get('/api/leaderboard/percentile/').status_code, 200)
+
+    async def test_leaderboard_stream(self):
+        response = await AsyncClient().get('/api/leaderboard/stream/',
+                                           headers={'Authorization': f'Token {self.token.key}'})
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_inline_background_tasks_are_not_counted(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            User.objects.count()
+            run_tasks([('touch_last_login', (self.user.pk, 0.0))])
+        self.assertEqual(recorder.count, 1)
+
+    @override_settings(QUERY_BUDGET_MODE='off')
+    def test_queries_are_recorded_for_metrics_when_budgets_are_off(self):
+        observed = DB_QUERIES.labels('user')._sum.get()
+        self.client.get('/api/auth/user/')
+        self.assertGreater(DB_QUERIES.labels('user')._sum.get(), observed)
+
+    def test_overall_leaderboard(self):
+        self.assertEqual(self.client.get('/api/leaderboard/overall/').status_code, 200)
+
+
+class AsyncMiddlewareTests(APITestCase):
+
+    @override_settings(DEBUG=True)
+    def test_asgi_stack_needs_no_sync_adapters(self):
+        # Django logs each middleware it has to wrap in sync_to_async/async_to_sync
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    async def test_async_view_is_served(self):
+        response = await AsyncClient().post('/api/auth/google/async/', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    async def test_queries_are_recorded_under_asgi(self):
+        token = await Token.objects.acreate(user=self.user)
+        observed = DB_QUERIES.labels('user')._sum.get()
+        response = await AsyncClient().get('/api/auth/user/', headers={'Authorization': f'Token {token.key}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(DB_QUERIES.labels('user')._sum.get(), observed)
+
+    async def test_queued_async_request_is_admitted_or_shed_without_blocking(self):
+        controller = AdmissionController(1)
+        self.assertTrue(await controller.aacquire(READ, 0))
+        self.assertFalse(await controller.aacquire(READ, 0.05))
+        waiter = asyncio.ensure_future(controller.aacquire(READ, 1))
+        await asyncio.sleep(0.02)
+        controller.release()
+        self.assertTrue(await waiter)
+
+
+class LeaderboardStreamTests(APITestCase):
+
+    async def open_stream(self):
+        token = await Token.objects.acreate(user=self.user)
+        return await AsyncClient().get('/api/leaderboard/stream/', headers={'Authorization': f'Token {token.key}'})
+
+    async def test_unread_stream_leaves_no_subscriber(self):
+        response = await self.open_stream()
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertEqual(broker.channels, {})
+
+    def test_stream_is_refused_under_wsgi(self):
+        token = Token.objects.create(user=self.user)
+        response = self.client.get('/api/leaderboard/stream/', {'token': token.key})
+        self.assertEqual(response.status_code, 501)
+        self.assertFalse(response.streaming)
+        self.assertEqual(broker.channels, {})
+
+    async def test_closed_stream_unsubscribes(self):
+        stream = _event_stream(game_config_key('fretboard', fretboard_params(12, 6, 1)), 10)
+        self.assertIn('event: leaderboard', await anext(stream))
+        self.assertEqual(sum(channel.subscribers for channel in broker.channels.values()), 1)
+        await stream.aclose()
+        self.assertEqual(broker.channels, {})
@@ -2,11 +2,15 @@
 from django.urls import path
 from .views import (
     GoogleLoginView, RegisterView, LoginView, LogoutView, UserView, active_users,
-    GameScoreView, leaderboard  # Add these new views
+    GameScoreView, leaderboard, leaderboard_batch,  # Add these new views
+    score_histogram, score_percentile, overall_leaderboard
 )
+from .leaderboard_stream import leaderboard_stream
+from .async_views import google_login_async
 
 urlpatterns = [
     path('auth/google/', GoogleLoginView.as_view(), name='google-login'),
+    path('auth/google/async/', google_login_async, name='google-login-async'),
     path('auth/register/', RegisterView.as_view(), name='register'),
     path('auth/login/', LoginView.as_view(), name='login'),
     path('auth/logout/', LogoutView.as_view(), name='logout'),
@@ -16,4 +20,9 @@ urlpatterns = [
     # Game score endpoints
     path('game-scores/', GameScoreView.as_view(), name='game-scores'),
     path('leaderboard/', leaderboard, name='leaderboard'),
+    path('leaderboard/batch/', leaderboard_batch, name='leaderboard-batch'),
+    path('leaderboard/histogram/', score_histogram, name='score-histogram'),
+    path('leaderboard/percentile/', score_percentile, name='score-percentile'),
+    path('leaderboard/stream/', leaderboard_stream, name='leaderboard-stream'),
+    path('leaderboard/overall/', overall_leaderboard, name='overall-leaderboard'),
 ]
\ No newline at end of file
@@ -2,15 +2,14 @@
 import json
 from django.conf import settings
 from django.contrib.auth import get_user_model, authenticate
+from django.db import transaction, IntegrityError
 from django.utils import timezone
 from rest_framework import status, permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAdminUser
-from google.oauth2 import id_token
-from google.auth.transport import requests
 
 from .serializers import (
     UserSerializer, 
@@ -18,15 +17,29 @@ from .serializers import (
     RegisterSerializer, 
     LoginSerializer,
     GameScoreSerializer,
-    GameScoreSummarySerializer
+    BatchLeaderboardSerializer
 )
 from .session_models import UserSession
-from .models import GameScore
+from .models import GameScore, GameConfig, game_config_key, game_config_params, request_config_key
+from .leaderboard import (
+    get_leaderboard, get_best_score, best_score_changed, leaderboard_changed, fetch_top_scores_batch,
+    LEADERBOARD_FIELDS
+)
+from .leaderboard_stream import notify_score_changed
+from .histograms import get_histogram, percentile, bucket_width
+from .skill import get_skill_leaderboard, SKILL_FIELDS
+from .tasks import enqueue
+from .metrics import LOGINS, SCORE_SUBMISSIONS
+from .ratelimit import TokenBucketThrottle
+from .idempotency import idempotent
+from .renderers import TABULAR_RENDERERS, table
 
 User = get_user_model()
 
 class GoogleLoginView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'login'
     serializer_class = GoogleAuthSerializer
 
     def post(self, request):
@@ -40,6 +53,11 @@ class GoogleLoginView(APIView):
         credential = serializer.validated_data.get('credential')
         print(f"Credential received: {credential[:20]}...")  # Log part of the credential for debugging
         
+        # Imported here: google.auth's transport pulls in requests/urllib3, which
+        # only this endpoint needs, so workers don't pay for them at startup
+        from google.oauth2 import id_token
+        from google.auth.transport import requests
+        
         try:
             # Verify the Google token
             print(f"Verifying token with client ID: {settings.GOOGLE_OAUTH2_CLIENT_ID}")
@@ -55,10 +73,12 @@ class GoogleLoginView(APIView):
             # Get user details from the token
             email = idinfo.get('email')
             if not email:
+                LOGINS.labels('google', 'invalid').inc()
                 return Response({'error': 'Email not found in token'}, status=status.HTTP_400_BAD_REQUEST)
             
             # Check if the email is verified by Google
             if not idinfo.get('email_verified', False):
+                LOGINS.labels('google', 'invalid').inc()
                 return Response({'error': 'Email not verified by Google'}, status=status.HTTP_400_BAD_REQUEST)
             
             # Extract user information
@@ -99,6 +119,7 @@ class GoogleLoginView(APIView):
             user_serializer = UserSerializer(user)
             
             # Return token and user data
+            LOGINS.labels('google', 'success').inc()
             return Response({
                 'token': token.key,
                 'user': user_serializer.data
@@ -106,15 +127,20 @@ class GoogleLoginView(APIView):
             
         except ValueError as e:
             print(f"Google token verification error: {str(e)}")
+            LOGINS.labels('google', 'invalid').inc()
             return Response({'error': f'Invalid token: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             print(f"Unexpected error: {str(e)}")
+            LOGINS.labels('google', 'error').inc()
             return Response({'error': f'Server error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class RegisterView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'register'
     serializer_class = RegisterSerializer
 
+    @idempotent('register')
     def post(self, request):
         serializer = self.serializer_class(data=request.data)
         if not serializer.is_valid():
@@ -130,15 +156,22 @@ class RegisterView(APIView):
         if User.objects.filter(email=user_data['email']).exists():
             return Response({'error': 'User with this email already exists'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Create user
-        user = User.objects.create_user(
-            username=username,
-            email=user_data['email'],
-            password=user_data['password'],
-            first_name=user_data.get('first_name', ''),
-            last_name=user_data.get('last_name', ''),
-            provider='email'
-        )
+        # Create user. The check above can race a concurrent registration;
+        # the username's unique constraint settles it.
+        try:
+            with transaction.atomic():
+                user = User.objects.create_user(
+                    username=username,
+                    email=user_data['email'],
+                    password=user_data['password'],
+                    first_name=user_data.get('first_name', ''),
+                    last_name=user_data.get('last_name', ''),
+                    provider='email'
+                )
+        except IntegrityError:
+            if User.objects.filter(email=user_data['email']).exists():
+                return Response({'error': 'User with this email already exists'}, status=status.HTTP_400_BAD_REQUEST)
+            return Response({'error': 'User with this username already exists'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Generate token for the user
         token, created = Token.objects.get_or_create(user=user)
@@ -154,6 +187,8 @@ class RegisterView(APIView):
 
 class LoginView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'login'
     serializer_class = LoginSerializer
 
     def post(self, request):
@@ -169,6 +204,7 @@ class LoginView(APIView):
             user_obj = User.objects.get(email=email)
             username = user_obj.username
         except User.DoesNotExist:
+            LOGINS.labels('email', 'invalid').inc()
             return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
         
         # Authenticate with username and password
@@ -182,11 +218,13 @@ class LoginView(APIView):
             user_serializer = UserSerializer(user)
             
             # Return token and user data
+            LOGINS.labels('email', 'success').inc()
             return Response({
                 'token': token.key,
                 'user': user_serializer.data
             }, status=status.HTTP_200_OK)
         else:
+            LOGINS.labels('email', 'invalid').inc()
             return Response({'error': 'Invalid credentials'}, status=status.HTTP_401_UNAUTHORIZED)
 
 class LogoutView(APIView):
@@ -210,7 +248,7 @@ def active_users(request):
     """
     # Get sessions active in the last 15 minutes
     threshold = timezone.now() - timezone.timedelta(minutes=15)
-    active_sessions = UserSession.objects.filter(last_activity__gt=threshold)
+    active_sessions = UserSession.objects.filter(last_activity__gt=threshold).select_related('user')
     
     # Get unique users from these sessions
     users = [session.user for session in active_sessions]
@@ -227,20 +265,21 @@ class GameScoreView(APIView):
     """
     API endpoint for managing user game scores
     """
+    throttle_classes = [TokenBucketThrottle]
+    throttle_scope = 'score-submit'
+    
     def get(self, request):
         """Get the user's best score for a specific game with specific configuration"""
         user = request.user
         game_type = request.query_params.get('game_type', 'fretboard')
         
-        # Convert parameters to integers to ensure proper comparison
+        # The configuration's params, as the game type defines them
         try:
-            fret_length = int(request.query_params.get('fret_length', 12))
-            start_string = int(request.query_params.get('start_string', 6))
-            end_string = int(request.query_params.get('end_string', 1))
+            params = game_config_params(game_type, request.query_params)
         except ValueError:
-            # Handle case where parameters can't be converted to int
+            # Unknown game type, or parameters that can't be converted
             return Response({
-                'error': 'Invalid numeric parameters'
+                'error': 'Invalid game configuration parameters'
             }, status=status.HTTP_400_BAD_REQUEST)
         
         # Get current score from query parameters (for first-time players)
@@ -253,18 +292,12 @@ class GameScoreView(APIView):
         
         try:
             # Get the best score for this game configuration
-            best_score = GameScore.objects.filter(
-                user=user,
-                game_type=game_type,
-                fret_length=fret_length,
-                start_string=start_string,
-                end_string=end_string
-            ).order_by('-score').first()
+            best_score = get_best_score(user, game_config_key(game_type, params))
             
             # Debugging
-            print(f"Best score query for {user.username}: game_type={game_type}, fret_length={fret_length}, strings={start_string}-{end_string}")
+            print(f"Best score query for {user.username}: game_type={game_type}, params={params}")
             if best_score:
-                print(f"Found best score: {best_score.score}, date: {best_score.date_achieved}")
+                print(f"Found best score: {best_score['score']}, date: {best_score['date_achieved']}")
             else:
                 print("No scores found in database for this configuration")
             
@@ -281,8 +314,7 @@ class GameScoreView(APIView):
             #    })
             
             if best_score:
-                serializer = GameScoreSummarySerializer(best_score)
-                return Response(serializer.data)
+                return Response(best_score)
             else:
                 # For first-time players, use the current score (if provided)
                 score_value = current_score if current_score is not None else 0
@@ -290,9 +322,7 @@ class GameScoreView(APIView):
                 return Response({
                     'score': score_value,
                     'date_achieved': timezone.now().isoformat() if score_value > 0 else None,
-                    'fret_length': fret_length,
-                    'start_string': start_string,
-                    'end_string': end_string,
+                    **params,
                     'username': user.username
                 })
                 
@@ -300,6 +330,7 @@ class GameScoreView(APIView):
             print(f"Error in GameScoreView.get: {str(e)}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @idempotent('score-submit')
     def post(self, request):
         """Save a new game score"""
         # Add the user to the data
@@ -316,66 +347,175 @@ class GameScoreView(APIView):
                     data[field] = int(data[field])
                 except (ValueError, TypeError):
                     print(f"Invalid value for field {field}: {data.get(field)}")
+                    SCORE_SUBMISSIONS.labels('invalid').inc()
                     return Response({
                         'error': f'Invalid value for {field}'
                     }, status=status.HTTP_400_BAD_REQUEST)
         
+        # The configuration's params, as the game type defines them
+        game_type = data.get('game_type', 'fretboard')
+        try:
+            params = game_config_params(game_type, data)
+        except ValueError:
+            SCORE_SUBMISSIONS.labels('invalid').inc()
+            return Response({
+                'error': 'Invalid value for game_type'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
         # Check if a record with this configuration already exists
         try:
             existing_score = GameScore.objects.get(
                 user=request.user,
-                game_type=data.get('game_type', 'fretboard'),
-                fret_length=data.get('fret_length', 12),
-                start_string=data.get('start_string', 6),
-                end_string=data.get('end_string', 1)
+                config_id=game_config_key(game_type, params)
             )
             
             print(f"Found existing score: {existing_score.score}")
             
             # Only update if the new score is higher
-            if data['score'] > existing_score.score:
+            while data['score'] > existing_score.score:
+                previous_score = existing_score.score
+                date_achieved = timezone.now()  # Update timestamp to current time
+                # Compare-and-set on the score we read: a concurrent improvement
+                # makes this match nothing, so each delta is applied against the
+                # score it actually replaced and the best never goes down
+                updated = GameScore.objects.filter(pk=existing_score.pk, score=previous_score).update(
+                    score=data['score'], date_achieved=date_achieved
+                )
+                if not updated:
+                    existing_score.refresh_from_db(fields=['score', 'date_achieved'])
+                    continue
                 existing_score.score = data['score']
-                existing_score.date_achieved = timezone.now()  # Update timestamp to current time
-                existing_score.save()
+                existing_score.date_achieved = date_achieved
                 print(f"Updated score to: {existing_score.score}")
+                _score_changed(existing_score, previous_score)
+                SCORE_SUBMISSIONS.labels('improved').inc()
                 serializer = GameScoreSerializer(existing_score)
                 return Response(serializer.data, status=status.HTTP_200_OK)
-            else:
-                # Return the existing score if it's higher
-                print(f"Keeping existing higher score: {existing_score.score}")
-                serializer = GameScoreSerializer(existing_score)
-                return Response(serializer.data, status=status.HTTP_200_OK)
+            
+            # Return the existing score if it's higher
+            print(f"Keeping existing higher score: {existing_score.score}")
+            SCORE_SUBMISSIONS.labels('kept').inc()
+            serializer = GameScoreSerializer(existing_score)
+            return Response(serializer.data, status=status.HTTP_200_OK)
                 
         except GameScore.DoesNotExist:
             # Create a new score record
             print("No existing score found. Creating new record.")
             serializer = GameScoreSerializer(data=data)
             if serializer.is_valid():
-                new_score = serializer.save()
+                new_score = serializer.save(config_id=GameConfig.get_key(game_type, params))
                 print(f"Created new score record: {new_score.score}")
+                _score_changed(new_score)
+                SCORE_SUBMISSIONS.labels('created').inc()
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             print(f"Serializer validation errors: {serializer.errors}")
+            SCORE_SUBMISSIONS.labels('invalid').inc()
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             print(f"Error in GameScoreView.post: {str(e)}")
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def _score_changed(game_score, previous_score=None):
+    """Refresh everything derived from a config's scores after a write"""
+    best_score_changed(game_score)
+    enqueue('record_score_change', game_score.config_id, game_score.score, previous_score)
+    if previous_score is None:
+        enqueue('record_skill_change', game_score.user_id, game_score.score, 1)
+    else:
+        enqueue('record_skill_change', game_score.user_id, game_score.score - previous_score, 0)
+    leaderboard_changed(game_score.config_id)
+    notify_score_changed(game_score.config_id, game_score.score)
+
 @api_view(['GET'])
+@renderer_classes(TABULAR_RENDERERS)
 def leaderboard(request):
     """Get the leaderboard for a specific game"""
-    game_type = request.query_params.get('game_type', 'fretboard')
-    fret_length = request.query_params.get('fret_length', 12)
-    start_string = request.query_params.get('start_string', 6)
-    end_string = request.query_params.get('end_string', 1)
-    limit = int(request.query_params.get('limit', 10))
+    try:
+        config_key = request_config_key(request.query_params)
+        limit = int(request.query_params.get('limit', 10))
+    except ValueError:
+        return Response({
+            'error': 'Invalid game configuration parameters'
+        }, status=status.HTTP_400_BAD_REQUEST)
     
-    # Get the top scores
-    top_scores = GameScore.objects.filter(
-        game_type=game_type,
-        fret_length=fret_length,
-        start_string=start_string,
-        end_string=end_string
-    ).order_by('-score')[:limit]
+    # Get the top scores (cached, with concurrent misses coalesced)
+    top_scores = get_leaderboard(config_key, limit)
+    return Response(table(request, LEADERBOARD_FIELDS, top_scores))
+
+@api_view(['POST'])
+@renderer_classes(TABULAR_RENDERERS)
+def leaderboard_batch(request):
+    """Get the leaderboards for several game configurations in one request"""
+    serializer = BatchLeaderboardSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Keyed by config key: keeps request order and drops duplicates
+    configs = {}
+    for config in serializer.validated_data['configs']:
+        configs.setdefault(request_config_key(config), config)
+    boards = fetch_top_scores_batch(list(configs), serializer.validated_data['limit'])
+    
+    return Response([{
+        **config,
+        'entries': table(request, LEADERBOARD_FIELDS, boards[config_key])
+    } for config_key, config in configs.items()])
+
+@api_view(['GET'])
+@renderer_classes(TABULAR_RENDERERS)
+def overall_leaderboard(request):
+    """Get the top players by best scores summed across all game configurations"""
+    try:
+        limit = int(request.query_params.get('limit', 10))
+    except ValueError:
+        return Response({
+            'error': 'Invalid numeric parameters'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(table(request, SKILL_FIELDS, get_skill_leaderboard(limit)))
+
+@api_view(['GET'])
+def score_histogram(request):
+    """Get the distribution of players' best scores for a game configuration"""
+    try:
+        config_key = request_config_key(request.query_params)
+    except ValueError:
+        return Response({
+            'error': 'Invalid game configuration parameters'
+        }, status=status.HTTP_400_BAD_REQUEST)
     
-    serializer = GameScoreSummarySerializer(top_scores, many=True)
-    return Response(serializer.data)
\ No newline at end of file
+    width = bucket_width()
+    histogram = get_histogram(config_key)
+    return Response({
+        'bucket_width': width,
+        'total_players': sum(count for bucket, count in histogram),
+        'buckets': [{
+            'min_score': bucket * width,
+            'max_score': (bucket + 1) * width - 1,
+            'count': count
+        } for bucket, count in histogram]
+    })
+
+@api_view(['GET'])
+def score_percentile(request):
+    """Get the percentage of players a score beats (defaults to the user's best score)"""
+    try:
+        config_key = request_config_key(request.query_params)
+        score = request.query_params.get('score', None)
+        if score is not None:
+            score = int(score)
+    except ValueError:
+        return Response({
+            'error': 'Invalid numeric parameters'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if score is None:
+        best_score = get_best_score(request.user, config_key)
+        score = best_score['score'] if best_score else 0
+    
+    histogram = get_histogram(config_key)
+    return Response({
+        'score': score,
+        'percentile': percentile(histogram, score),
+        'total_players': sum(count for bucket, count in histogram)
+    })
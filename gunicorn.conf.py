@@ -0,0 +1,5 @@
+# gunicorn.conf.py
+# Picked up automatically when gunicorn is started from this directory.
+# Runs in the master process, which is the only one that sees every worker
+# exit, including workers that were killed or crashed.
+from authentication.metrics import child_exit  # noqa: F401